@@ -0,0 +1,192 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+import redis.asyncio as aioredis
+from redis.exceptions import LockError, RedisError
+from dotenv import load_dotenv
+from app.cache import CACHE_KEY_PREFIX
+
+load_dotenv()
+
+# Agent runs allowed at the same time across all threads
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 32))
+# Requests allowed to wait for a slot; beyond that new requests get 429
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 64))
+# Longest a request may wait in the queue before it is shed
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", 30))
+# With several API workers, turns of one thread are also serialized through a
+# Redis lock, the in-process lock only covers requests of the same worker
+ADMISSION_REDIS_URL = os.getenv("ADMISSION_REDIS_URL")
+# Expiry of the Redis thread lock, frees a thread whose worker died mid-turn
+ADMISSION_THREAD_LOCK_TTL = float(os.getenv("ADMISSION_THREAD_LOCK_TTL_S", 300))
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; `retry_after` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request, holds its thread slot and a global slot until released."""
+
+    def __init__(self, controller: "AdmissionController", thread_id: str, shared_lock=None):
+        self._controller = controller
+        self._thread_id = thread_id
+        self._shared_lock = shared_lock
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self._thread_id, time.monotonic() - self._started)
+        if self._shared_lock is not None:
+            _release_shared(self._shared_lock)
+
+
+def _release_shared(lock):
+    async def release():
+        try:
+            await lock.release()
+        except LockError:
+            # Expired and possibly taken by another worker already
+            pass
+        except Exception as e:
+            print(f"[ERROR]: admission thread lock, {e}")
+
+    asyncio.ensure_future(release())
+
+
+class AdmissionController:
+    """Admission control in front of the agent.
+
+    Turns on the same thread_id run one at a time in arrival order (asyncio
+    locks are FIFO), at most `max_concurrent` runs execute overall, and at most
+    `max_queue` requests wait; anything beyond is rejected with a Retry-After
+    estimate instead of piling up.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        redis_url: str | None = ADMISSION_REDIS_URL,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._redis = aioredis.from_url(redis_url) if redis_url else None
+        # thread_id -> [lock, number of requests holding or waiting for it]
+        self._threads = {}
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.shared_lock_errors = 0
+        self._wait_times = deque(maxlen=1000)
+        # Moving average of how long an admitted run holds its slot
+        self._service_time = 1.0
+
+    def _retry_after(self) -> int:
+        backlog = (self.waiting + 1) / self.max_concurrent
+        return max(1, math.ceil(backlog * self._service_time))
+
+    async def acquire(self, thread_id: str) -> Ticket:
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("admission queue is full", self._retry_after())
+
+        entry = self._threads.setdefault(thread_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        self.waiting += 1
+        started = time.monotonic()
+        thread_locked = False
+        shared_lock = None
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await entry[0].acquire()
+                thread_locked = True
+                if self._redis is not None:
+                    lock = self._redis.lock(
+                        f"{CACHE_KEY_PREFIX}:thread-lock:{thread_id}",
+                        timeout=ADMISSION_THREAD_LOCK_TTL,
+                        sleep=0.05,
+                    )
+                    try:
+                        await lock.acquire()
+                        shared_lock = lock
+                    except RedisError as e:
+                        # Redis down: keep serving, turns of this thread are
+                        # still serialized within this worker
+                        self.shared_lock_errors += 1
+                        print(f"[ERROR]: admission thread lock, {e}")
+                await self._semaphore.acquire()
+        except BaseException as e:
+            self._leave_thread(thread_id, thread_locked)
+            if shared_lock is not None:
+                _release_shared(shared_lock)
+            if isinstance(e, TimeoutError):
+                self.timed_out += 1
+                raise Overloaded("timed out waiting for admission", self._retry_after())
+            raise
+        finally:
+            self.waiting -= 1
+
+        self._wait_times.append(time.monotonic() - started)
+        self.active += 1
+        self.admitted += 1
+        return Ticket(self, thread_id, shared_lock)
+
+    def _leave_thread(self, thread_id: str, locked: bool):
+        entry = self._threads[thread_id]
+        if locked:
+            entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._threads[thread_id]
+
+    def _release(self, thread_id: str, held: float):
+        self.active -= 1
+        self._service_time = 0.9 * self._service_time + 0.1 * held
+        self._semaphore.release()
+        self._leave_thread(thread_id, True)
+
+    @asynccontextmanager
+    async def admit(self, thread_id: str):
+        ticket = await self.acquire(thread_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_times)
+
+        def percentile(q):
+            return waits[min(len(waits) - 1, int(q * len(waits)))] * 1000 if waits else 0.0
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "shared_thread_locks": self._redis is not None,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "threads": len(self._threads),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "shared_lock_errors": self.shared_lock_errors,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": waits[-1] * 1000 if waits else 0.0,
+        }
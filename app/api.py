@@ -1,13 +1,42 @@
 import uuid
-import asyncio
-from starlette.responses import JSONResponse, StreamingResponse
-from app.agent import agent, Context
-from fastapi import FastAPI
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from app import retrieval
+from app.admission import AdmissionController, Overloaded
+from app.agent import Context
+from app.batch import ASK_CONCURRENCY, ASK_MAX_QUESTIONS, answer_all
+from app.cache import get_answer_cache, get_embedding_cache
+from app.checkpointer import pool_stats
+from app.embeddings import embedding_stats
+from app.metrics import observe, render, request_trace
+from app.rerank import rerank_stats
+from app.startup import Startup
+from app.streaming import sse_stream
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Dependencies connect in the background, /readyz reports when they are up
+    app.state.startup = startup = Startup()
+    startup.start(app)
+    try:
+        yield
+    finally:
+        await startup.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+admission = AdmissionController()
+
+AGENT_MODEL = os.getenv("AGENT_MODEL")
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,16 +48,14 @@ app.add_middleware(
 
 
 # Feature Functions
-def invoke_agent(agent, user_request):
-    try:
-        response = agent.invoke(
-            {"messages": [{"role": "user", "content": user_request.input}]},
-            context=Context(doc_content_hash=user_request.doc_content_hash),
-        )
-        return response
-    except Exception as e:
-        print(f"[ERROR]: chat, {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+async def invoke_agent(agent, question: str, doc_content_hash: str, thread_id: str) -> str:
+    """One non-streaming agent run, returns the text of the final answer."""
+    response = await agent.ainvoke(
+        {"messages": [{"role": "user", "content": question}]},
+        {"configurable": {"thread_id": thread_id}},
+        context=Context(doc_content_hash=doc_content_hash),
+    )
+    return response["messages"][-1].text
 
 
 # HTTP Models
@@ -38,31 +65,257 @@ class UserRequest(BaseModel):
     thread_id: str
 
 
+class AskRequest(BaseModel):
+    doc_content_hash: str
+    questions: list[str] = Field(min_length=1, max_length=ASK_MAX_QUESTIONS)
+    concurrency: int = Field(default=ASK_CONCURRENCY, ge=1, le=ASK_CONCURRENCY)
+
+
 class AskResponse(BaseModel):
-    answer: str
+    index: int
+    question: str
+    answer: str | None
+    error: str | None
+    seconds: float
+
+
+class AskBatchResponse(BaseModel):
+    doc_content_hash: str
+    results: list[AskResponse]
+    seconds: float
+
+
+def _not_ready():
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Service is starting"},
+        headers={"Retry-After": "1"},
+    )
+
+
+async def _ask_results(ask_request: AskRequest, agent):
+    """Answers of an /ask request in completion order. Every question runs
+    statelessly on the checkpointer-less batch agent and goes through
+    admission like a /chat turn, under a thread id of its own."""
+    doc_content_hash = ask_request.doc_content_hash
+    print(f"ask request, hash: {doc_content_hash}, questions: {len(ask_request.questions)}")
+    try:
+        await retrieval.aprepare_document(doc_content_hash)
+    except Exception as e:
+        # Searches fall back to Chroma on their own
+        print(f"[ERROR]: ask prepare {doc_content_hash}, {e}")
+
+    async def answer(index: int, question: str) -> str:
+        thread_id = f"ask-{uuid.uuid4()}"
+        with request_trace(route="/ask", doc_content_hash=doc_content_hash, index=index):
+            async with admission.admit(thread_id):
+                return await invoke_agent(agent, question, doc_content_hash, thread_id)
+
+    async for result in answer_all(ask_request.questions, answer, ask_request.concurrency):
+        yield result
 
 
 @app.post("/chat")
-async def chat(user_request: UserRequest):
+async def chat(user_request: UserRequest, request: Request):
     print(
         f"user request, hash: {user_request.doc_content_hash}, thread_id: {user_request.thread_id}, input: {user_request.input}"
     )
 
+    if not request.app.state.startup.ready:
+        return _not_ready()
+    agent = request.app.state.agent
+
+    try:
+        ticket = await admission.acquire(user_request.thread_id)
+    except Overloaded as e:
+        print(f"[ERROR]: chat rejected, {e}")
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    # Retrieval for the input starts now, overlapping the model's first step
+    retrieval.start_prefetch(user_request.input, user_request.doc_content_hash)
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            ticket.release()
+            retrieval.release_prefetch(user_request.input, user_request.doc_content_hash)
+
+    async def model_text():
+        started = time.perf_counter()
+        first_token = True
+        response = agent.astream(
+            {
+                "messages": [{"role": "user", "content": user_request.input}],
+            },
+            {"configurable": {"thread_id": user_request.thread_id}},
+            context=Context(doc_content_hash=user_request.doc_content_hash),
+            stream_mode="messages",
+        )
+        async for message, metadata in response:
+            if metadata["langgraph_node"] == "model" and message.content:
+                if first_token:
+                    observe("ttft", time.perf_counter() - started, model=AGENT_MODEL)
+                    first_token = False
+                yield message.text
+
     async def event_generator():
         try:
-            response = agent.stream(
-                {
-                    "messages": [{"role": "user", "content": user_request.input}],
-                },
-                {"configurable": {"thread_id": user_request.thread_id}},
-                context=Context(doc_content_hash=user_request.doc_content_hash),
-                stream_mode="messages",
-            )
-            for message, metadata in response:
-                if metadata["langgraph_node"] == "model" and message.content:
-                    yield f"data: {message.text}\n\n"
-                    await asyncio.sleep(0)
-        except Exception as e:
-            yield f"data: [ERROR]: {str(e)}\n\n"
+            with request_trace(
+                route="/chat",
+                thread_id=user_request.thread_id,
+                doc_content_hash=user_request.doc_content_hash,
+            ):
+                async for frame in sse_stream(model_text(), request):
+                    yield frame
+        finally:
+            release()
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    # The background task releases the ticket if the stream never started
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        background=BackgroundTask(release),
+    )
+
+
+@app.post("/ask", response_model=AskBatchResponse)
+async def ask(ask_request: AskRequest, request: Request):
+    """Answer a list of questions on one document, results in input order."""
+    if not request.app.state.startup.ready:
+        return _not_ready()
+    started = time.perf_counter()
+    results = [r async for r in _ask_results(ask_request, request.app.state.batch_agent)]
+    results.sort(key=lambda r: r["index"])
+    return {
+        "doc_content_hash": ask_request.doc_content_hash,
+        "results": results,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+@app.post("/ask/stream")
+async def ask_stream(ask_request: AskRequest, request: Request):
+    """`/ask` as NDJSON, one line per question as soon as it is answered;
+    `index` gives its position in the request."""
+    if not request.app.state.startup.ready:
+        return _not_ready()
+
+    async def lines():
+        async for result in _ask_results(ask_request, request.app.state.batch_agent):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/healthz")
+async def healthz(request: Request):
+    """Liveness: fails only when startup failed, so the process gets restarted."""
+    startup = request.app.state.startup
+    if startup.error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": startup.error})
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz(request: Request):
+    """Readiness: dependencies connected and clients warmed up."""
+    startup = request.app.state.startup
+    if not startup.ready:
+        return JSONResponse(status_code=503, content=startup.stats())
+    return startup.stats()
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus exposition: per-stage latency histograms plus the stats below."""
+    return PlainTextResponse(
+        render(
+            {
+                "startup": request.app.state.startup.stats(),
+                "admission": admission.stats(),
+                "checkpointer_pool": pool_stats(),
+                "cache": await cache_stats(),
+                "rerank": rerank_stats(),
+                "single_flight": retrieval.single_flight.stats(),
+                "prefetch": retrieval.prefetcher.stats(),
+                "retention": await retention_stats(request),
+                "invalidation": await invalidation_stats(request),
+            }
+        ),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@app.get("/stats/admission")
+async def admission_stats():
+    return admission.stats()
+
+
+@app.get("/stats/checkpointer")
+async def checkpointer_stats():
+    return pool_stats()
+
+
+@app.get("/stats/single-flight")
+async def single_flight_stats():
+    return retrieval.single_flight.stats()
+
+
+@app.get("/stats/prefetch")
+async def prefetch_stats():
+    return retrieval.prefetcher.stats()
+
+
+@app.get("/stats/invalidation")
+async def invalidation_stats(request: Request):
+    invalidation = request.app.state.startup.invalidation
+    return invalidation.stats() if invalidation else None
+
+
+@app.get("/stats/retention")
+async def retention_stats(request: Request):
+    retention = request.app.state.startup.retention
+    return retention.stats() if retention else None
+
+
+@app.get("/stats/cache")
+async def cache_stats():
+    return {
+        "embedding": get_embedding_cache().stats(),
+        "embedding_backend": embedding_stats(),
+        "answer": get_answer_cache().stats(),
+        "hot_index": retrieval.hot_index.stats() if retrieval.hot_index else None,
+        "partitions": retrieval.router.stats() if retrieval.router else None,
+    }
+
+
+@app.get("/stats/rerank")
+async def reranker_stats():
+    return rerank_stats()
+
+
+@app.delete("/cache/documents/{doc_content_hash}")
+async def invalidate_document(doc_content_hash: str, request: Request):
+    """Called by the ingestion pipeline after a document is re-ingested."""
+    removed = await get_answer_cache().ainvalidate(doc_content_hash)
+    retrieval.evict_document(doc_content_hash)
+    # The other workers evict their copy when the message reaches them
+    invalidation = request.app.state.startup.invalidation
+    published = False
+    if invalidation is not None:
+        try:
+            await invalidation.publish(doc_content_hash)
+            published = True
+        except Exception as e:
+            print(f"[ERROR]: invalidation publish {doc_content_hash}, {e}")
+    return {
+        "doc_content_hash": doc_content_hash,
+        "removed_keys": removed,
+        "published": published,
+    }
@@ -0,0 +1,44 @@
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Questions of one /ask request answered at the same time
+ASK_CONCURRENCY = int(os.getenv("ASK_CONCURRENCY", 8))
+# Questions accepted per /ask request
+ASK_MAX_QUESTIONS = int(os.getenv("ASK_MAX_QUESTIONS", 500))
+
+
+async def answer_all(questions: list[str], answer, concurrency: int = ASK_CONCURRENCY):
+    """Run `answer(index, question)` for every question, at most `concurrency`
+    at a time, yielding one result dict per question in completion order.
+
+    A failed question yields its error instead of failing the batch. Closing
+    the generator (e.g. on client disconnect) cancels the unfinished ones.
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def one(index: int, question: str) -> dict:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = {"answer": await answer(index, question), "error": None}
+            except Exception as e:
+                print(f"[ERROR]: ask {index}, {e}")
+                result = {"answer": None, "error": str(e)}
+            return {
+                "index": index,
+                "question": question,
+                **result,
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+
+    tasks = [asyncio.ensure_future(one(i, q)) for i, q in enumerate(questions)]
+    try:
+        for done in asyncio.as_completed(tasks):
+            yield await done
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,538 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+import numpy as np
+import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL") or os.getenv("RAG_REDIS_URL")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "qa-agent")
+
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", 7 * 24 * 3600))
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity between query embeddings to reuse a cached answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 256))
+# In-process copies of documents' cached query embeddings, reloaded on change
+ANSWER_CACHE_LOCAL_MAX_BYTES = int(os.getenv("ANSWER_CACHE_LOCAL_MAX_BYTES", 64 * 1024 * 1024))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a query used for cache keys: NFKC, casefolded, single spaces."""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def _pack(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(data: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class _LRU:
+    """Thread-safe in-process LRU bounded by an approximate byte budget."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            self._items.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes: int):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._items[key] = (value, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.size -= evicted
+
+    def __len__(self):
+        return len(self._items)
+
+
+class EmbeddingCache:
+    """Two-tier query embedding cache: in-process LRU backed by Redis.
+
+    Keys are the embedding model name plus the normalized query text. Redis is
+    optional, any Redis failure degrades to a miss instead of failing the query.
+    """
+
+    def __init__(
+        self,
+        redis_url: str | None = CACHE_REDIS_URL,
+        max_bytes: int = EMBED_CACHE_MAX_BYTES,
+        ttl: int = EMBED_CACHE_TTL,
+    ):
+        self.ttl = ttl
+        self._local = _LRU(max_bytes)
+        self._redis = redis.from_url(redis_url) if redis_url else None
+        self._aredis = aioredis.from_url(redis_url) if redis_url else None
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_name: str, query: str) -> str:
+        digest = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+        return f"{CACHE_KEY_PREFIX}:embed:{model_name}:{digest}"
+
+    def _remember(self, key: str, vector):
+        # Held as a float32 array, a list of Python floats is ~8x larger;
+        # plus a rough per-entry overhead for the key and the LRU slot
+        packed = array("f", vector)
+        self._local.put(key, packed, packed.itemsize * len(packed) + len(key) + 64)
+
+    def get(self, model_name: str, query: str) -> list[float] | None:
+        key = self.key(model_name, query)
+        vector = self._local.get(key)
+        if vector is not None:
+            self.hits_local += 1
+            return vector.tolist()
+        if self._redis is not None:
+            try:
+                data = self._redis.get(key)
+            except redis.RedisError as e:
+                print(f"[ERROR]: embedding cache, {e}")
+                data = None
+            if data is not None:
+                vector = _unpack(data)
+                self._remember(key, vector)
+                self.hits_redis += 1
+                return vector
+        self.misses += 1
+        return None
+
+    async def aget(self, model_name: str, query: str) -> list[float] | None:
+        key = self.key(model_name, query)
+        vector = self._local.get(key)
+        if vector is not None:
+            self.hits_local += 1
+            return vector.tolist()
+        if self._aredis is not None:
+            try:
+                data = await self._aredis.get(key)
+            except redis.RedisError as e:
+                print(f"[ERROR]: embedding cache, {e}")
+                data = None
+            if data is not None:
+                vector = _unpack(data)
+                self._remember(key, vector)
+                self.hits_redis += 1
+                return vector
+        self.misses += 1
+        return None
+
+    def put(self, model_name: str, query: str, vector: list[float]):
+        key = self.key(model_name, query)
+        self._remember(key, vector)
+        if self._redis is not None:
+            try:
+                self._redis.set(key, _pack(vector), ex=self.ttl)
+            except redis.RedisError as e:
+                print(f"[ERROR]: embedding cache, {e}")
+
+    async def aput(self, model_name: str, query: str, vector: list[float]):
+        key = self.key(model_name, query)
+        self._remember(key, vector)
+        if self._aredis is not None:
+            try:
+                await self._aredis.set(key, _pack(vector), ex=self.ttl)
+            except redis.RedisError as e:
+                print(f"[ERROR]: embedding cache, {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits_local + self.hits_redis + self.misses
+        hits = self.hits_local + self.hits_redis
+        return {
+            "hits_local": self.hits_local,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "local_entries": len(self._local),
+            "local_bytes": self._local.size,
+        }
+
+
+class _DocumentVectors:
+    """Query embeddings of one document's cached answers as a row-normalized
+    float32 matrix, so a lookup is a single matrix-vector product."""
+
+    def __init__(self, ids: list, modes: list[str], matrix):
+        self.ids = ids
+        self.modes = np.asarray(modes)
+        self.matrix = matrix
+        self.nbytes = matrix.nbytes + 64 * len(ids)
+
+    @classmethod
+    def from_redis(cls, raw: dict) -> "_DocumentVectors":
+        ids, modes, vectors = [], [], []
+        for entry_id, value in raw.items():
+            mode, _, data = value.partition(b"\0")
+            ids.append(entry_id)
+            modes.append(mode.decode("ascii"))
+            vectors.append(np.frombuffer(data, dtype=np.float32))
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return cls(ids, modes, matrix / np.where(norms == 0, 1, norms))
+
+    def best(self, embedding, mode: str, threshold: float):
+        """Id of the most similar entry of `mode` above the threshold, or None."""
+        query = np.asarray(embedding, dtype=np.float32)
+        if not self.ids or self.matrix.shape[1] != len(query):
+            return None
+        norm = np.linalg.norm(query)
+        # search_vdb answers and packed contexts share a document's entries
+        scores = np.where(self.modes == mode, self.matrix @ (query / (norm or 1)), -np.inf)
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        return self.ids[best]
+
+
+class AnswerCache:
+    """Semantic cache of search_vdb answers, partitioned by doc_content_hash.
+
+    Each document owns three Redis keys: a hash of entries (query, mode,
+    answer), a hash of their query embeddings as raw float32 bytes and a
+    sorted set of last-access times used for LRU eviction, plus a version
+    counter bumped on every write. Each process keeps the embeddings of
+    recently used documents as a matrix and reloads them only when the
+    version moves, so a lookup transfers the version and the matched answer.
+
+    Keys are namespaced by the embedding model (`namespace`), similarities
+    are only ever computed between vectors of one model.
+
+    A generation counter moves only on `invalidate`. Searches read it before
+    retrieving and pass it to `put`, which drops the answer if the document
+    was re-ingested in the meantime.
+    """
+
+    def __init__(
+        self,
+        redis_url: str | None = CACHE_REDIS_URL,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: int = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        local_max_bytes: int = ANSWER_CACHE_LOCAL_MAX_BYTES,
+        namespace: str = "",
+    ):
+        self.threshold = threshold
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._redis = redis.from_url(redis_url) if redis_url else None
+        self._aredis = aioredis.from_url(redis_url) if redis_url else None
+        # doc_content_hash -> (version, _DocumentVectors)
+        self._local = _LRU(local_max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._redis is not None
+
+    def _base_key(self, doc_content_hash: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:answer:{self.namespace}:{doc_content_hash}"
+
+    def _keys(self, doc_content_hash: str) -> tuple[str, str, str, str]:
+        base = self._base_key(doc_content_hash)
+        return f"{base}:entries", f"{base}:vectors", f"{base}:lru", f"{base}:version"
+
+    def _generation_key(self, doc_content_hash: str) -> str:
+        return f"{self._base_key(doc_content_hash)}:generation"
+
+    def generation(self, doc_content_hash: str) -> int | None:
+        """Current generation of the document, None when it cannot be read
+        (the answer is then not cached)."""
+        if self._redis is None:
+            return None
+        try:
+            return int(self._redis.get(self._generation_key(doc_content_hash)) or 0)
+        except redis.RedisError as e:
+            print(f"[ERROR]: answer cache, {e}")
+            return None
+
+    async def ageneration(self, doc_content_hash: str) -> int | None:
+        if self._aredis is None:
+            return None
+        try:
+            return int(await self._aredis.get(self._generation_key(doc_content_hash)) or 0)
+        except redis.RedisError as e:
+            print(f"[ERROR]: answer cache, {e}")
+            return None
+
+    @staticmethod
+    def _entry_id(query: str, mode: str) -> str:
+        key = f"{mode}:{normalize_query(query)}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _encode(query: str, answer: str, mode: str = "answer") -> str:
+        return json.dumps({"q": query, "m": mode, "a": answer}, ensure_ascii=False)
+
+    @staticmethod
+    def _encode_vector(embedding, mode: str = "answer") -> bytes:
+        return mode.encode("ascii") + b"\0" + _pack(embedding)
+
+    def _cached_vectors(self, doc_content_hash: str, version):
+        cached = self._local.get(doc_content_hash)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return None
+
+    def _remember(self, doc_content_hash: str, version, vectors: _DocumentVectors):
+        self.reloads += 1
+        self._local.put(doc_content_hash, (version, vectors), vectors.nbytes)
+
+    @staticmethod
+    def _answer(raw) -> str | None:
+        # None when the entry was evicted since the vectors were loaded
+        return json.loads(raw)["a"] if raw is not None else None
+
+    def get(self, doc_content_hash: str, embedding, mode: str = "answer") -> str | None:
+        if self._redis is None:
+            return None
+        entries_key, vectors_key, lru_key, version_key = self._keys(doc_content_hash)
+        match = None
+        try:
+            version = self._redis.get(version_key)
+            vectors = self._cached_vectors(doc_content_hash, version)
+            if vectors is None:
+                vectors = _DocumentVectors.from_redis(self._redis.hgetall(vectors_key))
+                self._remember(doc_content_hash, version, vectors)
+            entry_id = vectors.best(embedding, mode, self.threshold)
+            if entry_id is not None:
+                match = self._answer(self._redis.hget(entries_key, entry_id))
+                if match is not None:
+                    self._redis.zadd(lru_key, {entry_id: time.time()})
+        except redis.RedisError as e:
+            print(f"[ERROR]: answer cache, {e}")
+            match = None
+        return self._record(match)
+
+    async def aget(
+        self, doc_content_hash: str, embedding, mode: str = "answer"
+    ) -> str | None:
+        if self._aredis is None:
+            return None
+        entries_key, vectors_key, lru_key, version_key = self._keys(doc_content_hash)
+        match = None
+        try:
+            version = await self._aredis.get(version_key)
+            vectors = self._cached_vectors(doc_content_hash, version)
+            if vectors is None:
+                raw = await self._aredis.hgetall(vectors_key)
+                # Building the matrix is the only sizeable CPU step, keep it off the loop
+                vectors = await asyncio.to_thread(_DocumentVectors.from_redis, raw)
+                self._remember(doc_content_hash, version, vectors)
+            entry_id = vectors.best(embedding, mode, self.threshold)
+            if entry_id is not None:
+                match = self._answer(await self._aredis.hget(entries_key, entry_id))
+                if match is not None:
+                    await self._aredis.zadd(lru_key, {entry_id: time.time()})
+        except redis.RedisError as e:
+            print(f"[ERROR]: answer cache, {e}")
+            match = None
+        return self._record(match)
+
+    def _record(self, match) -> str | None:
+        if match is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return match
+
+    def put(
+        self,
+        doc_content_hash: str,
+        query: str,
+        embedding,
+        answer: str,
+        mode: str = "answer",
+        generation: int | None = None,
+    ):
+        """Store an answer computed while the document was at `generation`."""
+        if self._redis is None or generation is None:
+            return
+        keys = self._keys(doc_content_hash)
+        entries_key, vectors_key, lru_key, version_key = keys
+        generation_key = self._generation_key(doc_content_hash)
+        entry_id = self._entry_id(query, mode)
+        try:
+            with self._redis.pipeline() as pipe:
+                # WATCH: an invalidate between the check and EXEC aborts the write
+                pipe.watch(generation_key)
+                if int(pipe.get(generation_key) or 0) != generation:
+                    self.stale += 1
+                    return
+                pipe.multi()
+                pipe.hset(entries_key, entry_id, self._encode(query, answer, mode))
+                pipe.hset(vectors_key, entry_id, self._encode_vector(embedding, mode))
+                pipe.zadd(lru_key, {entry_id: time.time()})
+                pipe.incr(version_key)
+                for key in keys:
+                    pipe.expire(key, self.ttl)
+                pipe.zcard(lru_key)
+                size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = [m for m, _ in self._redis.zpopmin(lru_key, size - self.max_entries)]
+                pipe = self._redis.pipeline()
+                pipe.hdel(entries_key, *evicted)
+                pipe.hdel(vectors_key, *evicted)
+                pipe.incr(version_key)
+                pipe.execute()
+                self.evictions += len(evicted)
+        except redis.WatchError:
+            self.stale += 1
+        except redis.RedisError as e:
+            print(f"[ERROR]: answer cache, {e}")
+
+    async def aput(
+        self,
+        doc_content_hash: str,
+        query: str,
+        embedding,
+        answer: str,
+        mode: str = "answer",
+        generation: int | None = None,
+    ):
+        if self._aredis is None or generation is None:
+            return
+        keys = self._keys(doc_content_hash)
+        entries_key, vectors_key, lru_key, version_key = keys
+        generation_key = self._generation_key(doc_content_hash)
+        entry_id = self._entry_id(query, mode)
+        try:
+            async with self._aredis.pipeline() as pipe:
+                await pipe.watch(generation_key)
+                if int(await pipe.get(generation_key) or 0) != generation:
+                    self.stale += 1
+                    return
+                pipe.multi()
+                pipe.hset(entries_key, entry_id, self._encode(query, answer, mode))
+                pipe.hset(vectors_key, entry_id, self._encode_vector(embedding, mode))
+                pipe.zadd(lru_key, {entry_id: time.time()})
+                pipe.incr(version_key)
+                for key in keys:
+                    pipe.expire(key, self.ttl)
+                pipe.zcard(lru_key)
+                size = (await pipe.execute())[-1]
+            if size > self.max_entries:
+                popped = await self._aredis.zpopmin(lru_key, size - self.max_entries)
+                evicted = [m for m, _ in popped]
+                pipe = self._aredis.pipeline()
+                pipe.hdel(entries_key, *evicted)
+                pipe.hdel(vectors_key, *evicted)
+                pipe.incr(version_key)
+                await pipe.execute()
+                self.evictions += len(evicted)
+        except redis.WatchError:
+            self.stale += 1
+        except redis.RedisError as e:
+            print(f"[ERROR]: answer cache, {e}")
+
+    def invalidate(self, doc_content_hash: str) -> int:
+        """Drop every cached answer of a document, call it when the document is
+        re-ingested. Returns the number of Redis keys removed."""
+        if self._redis is None:
+            return 0
+        try:
+            return self._invalidate_pipeline(self._redis, doc_content_hash).execute()[0]
+        except redis.RedisError as e:
+            print(f"[ERROR]: answer cache, {e}")
+            return 0
+
+    async def ainvalidate(self, doc_content_hash: str) -> int:
+        if self._aredis is None:
+            return 0
+        try:
+            return (await self._invalidate_pipeline(self._aredis, doc_content_hash).execute())[0]
+        except redis.RedisError as e:
+            print(f"[ERROR]: answer cache, {e}")
+            return 0
+
+    def _invalidate_pipeline(self, client, doc_content_hash: str):
+        *keys, version_key = self._keys(doc_content_hash)
+        generation_key = self._generation_key(doc_content_hash)
+        pipe = client.pipeline()
+        pipe.unlink(*keys)
+        # Both counters only ever move forward: no process reuses old vectors,
+        # and searches that started before the re-ingest do not store answers
+        pipe.incr(version_key)
+        pipe.incr(generation_key)
+        pipe.expire(version_key, self.ttl)
+        pipe.expire(generation_key, self.ttl)
+        return pipe
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "threshold": self.threshold,
+            "vector_reloads": self.reloads,
+            "stale_puts": self.stale,
+            "local_documents": len(self._local),
+            "local_bytes": self._local.size,
+        }
+
+
+_embedding_cache = None
+_answer_cache = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        # app.embeddings imports this module
+        from app.embeddings import embedding_tag
+
+        _answer_cache = AnswerCache(
+            CACHE_REDIS_URL if ANSWER_CACHE_ENABLED else None, namespace=embedding_tag()
+        )
+    return _answer_cache
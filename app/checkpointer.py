@@ -0,0 +1,119 @@
+import os
+from contextlib import asynccontextmanager
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from dotenv import load_dotenv
+from app.metrics import span
+
+load_dotenv()
+
+# "postgres", or "memory" for local runs and benchmarks without a database
+AGENT_CHECKPOINTER = os.getenv("AGENT_CHECKPOINTER", "postgres")
+
+# Connection settings required by the langgraph postgres savers
+_CONNECTION_KWARGS = {
+    "autocommit": True,
+    "prepare_threshold": 0,
+    "row_factory": dict_row,
+}
+
+POOL_MIN_SIZE = int(os.getenv("AGENT_PG_POOL_MIN_SIZE", 2))
+POOL_MAX_SIZE = int(os.getenv("AGENT_PG_POOL_MAX_SIZE", 20))
+# Seconds a request may wait for a free connection before failing
+POOL_TIMEOUT = float(os.getenv("AGENT_PG_POOL_TIMEOUT", 30))
+# Idle connections are closed after this many seconds (down to min_size)
+POOL_MAX_IDLE = float(os.getenv("AGENT_PG_POOL_MAX_IDLE", 300))
+
+# Pools opened by this module, keyed by name, for stats reporting
+_pools = {}
+
+
+def _pool_options():
+    return dict(
+        conninfo=os.getenv("AGENT_PERSIS_POSTGRES_URL"),
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        timeout=POOL_TIMEOUT,
+        max_idle=POOL_MAX_IDLE,
+        kwargs=_CONNECTION_KWARGS,
+    )
+
+
+class InstrumentedAsyncPostgresSaver(AsyncPostgresSaver):
+    """AsyncPostgresSaver recording checkpoint I/O latency per operation.
+
+    Over a pool, operations run concurrently on connections of their own:
+    the base class holds one asyncio.Lock around every cursor, which only a
+    single shared connection needs.
+    """
+
+    @asynccontextmanager
+    async def _cursor(self, *, pipeline: bool = False):
+        if not isinstance(self.conn, AsyncConnectionPool):
+            async with super()._cursor(pipeline=pipeline) as cur:
+                yield cur
+            return
+        async with self.conn.connection() as conn:
+            if pipeline:
+                # Pipeline mode when available, a transaction otherwise, as upstream
+                batch = conn.pipeline() if self.supports_pipeline else conn.transaction()
+                async with batch, conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            else:
+                async with conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+
+    async def aget_tuple(self, config):
+        with span("checkpoint", op="get"):
+            return await super().aget_tuple(config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with span("checkpoint", op="put"):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        with span("checkpoint", op="put_writes"):
+            return await super().aput_writes(config, writes, task_id, task_path)
+
+
+def open_checkpointer() -> tuple[PostgresSaver, ConnectionPool]:
+    """Open a pooled sync checkpointer, the caller owns closing the returned pool."""
+    pool = ConnectionPool(
+        check=ConnectionPool.check_connection, open=True, **_pool_options()
+    )
+    _pools["sync"] = pool
+    checkpointer = PostgresSaver(pool)
+    checkpointer.setup()
+    return checkpointer, pool
+
+
+@asynccontextmanager
+async def open_async_checkpointer():
+    """Yield a pooled AsyncPostgresSaver, must be entered inside a running event
+    loop (e.g. the FastAPI lifespan)."""
+    if AGENT_CHECKPOINTER == "memory":
+        yield InMemorySaver()
+        return
+    # Broken connections are dropped on checkout and the pool reconnects in the
+    # background, so a database restart no longer takes the process down.
+    pool = AsyncConnectionPool(
+        check=AsyncConnectionPool.check_connection, open=False, **_pool_options()
+    )
+    await pool.open(wait=True)
+    _pools["async"] = pool
+    try:
+        checkpointer = InstrumentedAsyncPostgresSaver(pool)
+        await checkpointer.setup()
+        yield checkpointer
+    finally:
+        _pools.pop("async", None)
+        await pool.close()
+
+
+def pool_stats() -> dict:
+    """Snapshot of every open pool: size, queue and wait time counters
+    (see psycopg_pool `get_stats`)."""
+    return {name: pool.get_stats() for name, pool in _pools.items()}
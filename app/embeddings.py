@@ -0,0 +1,502 @@
+import asyncio
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+from pydantic import PrivateAttr
+from dotenv import load_dotenv
+from app.cache import EmbeddingCache, get_embedding_cache
+from app.metrics import batch_size, observe, span
+
+load_dotenv()
+
+# "google" (remote GenAI API) or "bge" (local FlagEmbedding model on CPU)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google")
+BGE_EMBED_MODEL = os.getenv("BGE_EMBED_MODEL", "BAAI/bge-m3")
+# Upper bound of texts encoded in one forward pass
+BGE_EMBED_MAX_BATCH = int(os.getenv("BGE_EMBED_MAX_BATCH", 32))
+# How long the worker waits for more concurrent requests before encoding
+BGE_EMBED_WAIT_MS = float(os.getenv("BGE_EMBED_WAIT_MS", 5))
+# Coalesce concurrent remote query embeddings into batched API calls
+EMBED_BATCH_ENABLED = os.getenv("EMBED_BATCH_ENABLED", "true").lower() == "true"
+# How long the first query of a batch waits for others to join
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 5))
+# A full batch is sent right away, also the batch size of document embeddings
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", 100))
+# Collection metadata key holding the embedding tag, see embedding_tag()
+EMBEDDING_TAG_KEY = "embedding_model"
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Wrap an embedding model so query embeddings go through an EmbeddingCache.
+
+    Only queries are cached; document embeddings are produced at ingestion time
+    and pass straight through to the wrapped model.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache: EmbeddingCache, **kwargs: Any):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs,
+        )
+        self._inner = inner
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        with span("embedding", model=self.model_name, cache="hit") as labels:
+            vector = self._cache.get(self.model_name, query)
+            if vector is None:
+                labels["cache"] = "miss"
+                vector = self._inner.get_query_embedding(query)
+                self._cache.put(self.model_name, query, vector)
+        return vector
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        with span("embedding", model=self.model_name, cache="hit") as labels:
+            vector = await self._cache.aget(self.model_name, query)
+            if vector is None:
+                labels["cache"] = "miss"
+                vector = await self._inner.aget_query_embedding(query)
+                await self._cache.aput(self.model_name, query, vector)
+        return vector
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._inner.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return await self._inner.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._inner.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return await self._inner.aget_text_embedding_batch(texts)
+
+
+class _GoogleEmbedding(GoogleGenAIEmbedding):
+    """GoogleGenAIEmbedding with a batched query call, the base class only
+    batches document embeddings."""
+
+    async def aget_query_embeddings(self, queries: list[str]) -> list[list[float]]:
+        return await self._aembed_texts(queries, task_type="RETRIEVAL_QUERY")
+
+
+class QueryBatcher:
+    """Coalesces concurrent single-query embedding calls into batched calls.
+
+    The first query of a batch opens a window of `wait_ms`; every query that
+    arrives meanwhile joins it, and the batch goes out when the window closes
+    or `max_batch` queries are waiting. Identical queries in a batch are sent
+    once. Runs on the event loop, so it needs no locks.
+    """
+
+    def __init__(
+        self,
+        batch_fn,
+        max_batch: int = EMBED_BATCH_MAX,
+        wait_ms: float = EMBED_BATCH_WAIT_MS,
+    ):
+        self._batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self._pending = []
+        self._timer = None
+        self._sending = set()
+        self.batches = 0
+        self.queries = 0
+        self.wait_seconds = 0.0
+
+    async def embed(self, query: str) -> list[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            # Keep a reference until the call completes
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch):
+        sent = time.perf_counter()
+        unique = list(dict.fromkeys(query for query, _, _ in batch))
+        for _, _, enqueued in batch:
+            observe("embedding_batch_wait", sent - enqueued)
+            self.wait_seconds += sent - enqueued
+        self.batches += 1
+        self.queries += len(batch)
+        batch_size.observe(len(unique), batcher="embedding")
+        try:
+            result = await self._batch_fn(unique)
+            if len(result) != len(unique):
+                raise ValueError(
+                    f"Embedding API returned {len(result)} vectors for {len(unique)} queries"
+                )
+            vectors = dict(zip(unique, result))
+            for query, future, _ in batch:
+                if not future.done():
+                    future.set_result(vectors[query])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # Cancelled mid-call: no waiter may be left pending
+            for _, future, _ in batch:
+                future.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_queries": self.queries / self.batches if self.batches else 0.0,
+            "avg_wait_ms": self.wait_seconds / self.queries * 1000 if self.queries else 0.0,
+        }
+
+
+class BatchedQueryEmbedding(BaseEmbedding):
+    """Wrap a model so async query embeddings go through a QueryBatcher.
+
+    The sync path and document embeddings pass straight through.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _batcher: QueryBatcher = PrivateAttr()
+
+    def __init__(self, inner: _GoogleEmbedding, batcher: QueryBatcher, **kwargs: Any):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs,
+        )
+        self._inner = inner
+        self._batcher = batcher
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BatchedQueryEmbedding"
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._inner.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return await self._batcher.embed(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._inner.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return await self._inner.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._inner.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return await self._inner.aget_text_embedding_batch(texts)
+
+
+# Batcher of the remote model, kept for stats
+_query_batcher = None
+
+
+def build_base_embed_model(backend: str | None = None) -> BaseEmbedding:
+    """The configured embedding model, without the query cache."""
+    if (backend or EMBEDDING_BACKEND) == "bge":
+        # The worker process batches on its own
+        return LocalEmbedding(get_bge_process(), BGE_EMBED_MODEL)
+    model = _GoogleEmbedding(
+        model_name=os.getenv("EMBEDDING_MODEL"),
+        embed_batch_size=EMBED_BATCH_MAX,
+    )
+    if not EMBED_BATCH_ENABLED:
+        return model
+    return BatchedQueryEmbedding(model, QueryBatcher(model.aget_query_embeddings))
+
+
+def build_embed_model() -> BaseEmbedding:
+    """Embedding model used for retrieval queries. Its query batcher is the
+    one `embedding_stats` reports, other models (benchmarks, re-indexing)
+    keep theirs to themselves."""
+    global _query_batcher
+    model = build_base_embed_model()
+    if isinstance(model, BatchedQueryEmbedding):
+        _query_batcher = model._batcher
+    return CachedEmbedding(model, get_embedding_cache())
+
+
+def load_bge_encoder(model_name: str):
+    """Load a FlagEmbedding model on CPU, runs inside the worker process."""
+    # Imported lazily, FlagEmbedding pulls in torch
+    from FlagEmbedding import FlagAutoModel
+
+    return FlagAutoModel.from_finetuned(model_name, use_fp16=False, devices="cpu")
+
+
+def _dense(vectors) -> list[list[float]]:
+    # BGE-M3 returns a dict of dense / sparse / colbert outputs
+    if isinstance(vectors, dict):
+        vectors = vectors["dense_vecs"]
+    return [list(map(float, v)) for v in vectors]
+
+
+def _embedding_worker(load_encoder, model_name, requests, responses, max_batch, wait):
+    """Worker process loop: merge concurrent requests into batches per kind
+    ("query" or "text") and encode each batch in one forward pass."""
+    try:
+        encoder = load_encoder(model_name)
+    except Exception as e:
+        responses.put(("error", str(e)))
+        return
+    responses.put(("ready", None))
+    while True:
+        jobs = [requests.get()]
+        if jobs[0] is None:
+            return
+        size = len(jobs[0][2])
+        deadline = time.monotonic() + wait
+        while size < max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is None:
+                return
+            jobs.append(job)
+            size += len(job[2])
+        for kind in ("query", "text"):
+            batch = [job for job in jobs if job[1] == kind]
+            if not batch:
+                continue
+            texts = [text for _, _, job_texts in batch for text in job_texts]
+            try:
+                encode = encoder.encode_queries if kind == "query" else encoder.encode_corpus
+                vectors = _dense(encode(texts))
+            except Exception as e:
+                for request_id, _, _ in batch:
+                    responses.put(("result", (request_id, None, str(e))))
+                continue
+            responses.put(("batch", len(texts)))
+            offset = 0
+            for request_id, _, job_texts in batch:
+                result = vectors[offset : offset + len(job_texts)]
+                responses.put(("result", (request_id, result, None)))
+                offset += len(job_texts)
+
+
+class EmbeddingProcess:
+    """Runs a local embedding model in a dedicated process.
+
+    The model gets its own interpreter, so encoding never holds the API
+    process's GIL. Requests submitted concurrently are merged into one
+    forward pass of up to `max_batch` texts, as RerankWorker does for pairs.
+    """
+
+    def __init__(
+        self,
+        model_name: str = BGE_EMBED_MODEL,
+        load_encoder=load_bge_encoder,
+        max_batch: int = BGE_EMBED_MAX_BATCH,
+        wait_ms: float = BGE_EMBED_WAIT_MS,
+        start_timeout: float = 600,
+    ):
+        context = multiprocessing.get_context("spawn")
+        self._requests = context.Queue()
+        self._responses = context.Queue()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        # Set by the reader when the worker process is gone
+        self._error = None
+        self.batches = 0
+        self.texts = 0
+        self._process = context.Process(
+            target=_embedding_worker,
+            args=(load_encoder, model_name, self._requests, self._responses, max_batch, wait_ms / 1000),
+            name="embedding-worker",
+            daemon=True,
+        )
+        self._process.start()
+        # Wait for the model to load so failures surface at startup
+        status, error = self._responses.get(timeout=start_timeout)
+        if status == "error":
+            self._process.join()
+            raise RuntimeError(f"Embedding worker failed to load {model_name}: {error}")
+        threading.Thread(target=self._read, name="embedding-reader", daemon=True).start()
+
+    def submit(self, texts: list[str], kind: str = "query") -> Future:
+        future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+        request_id = next(self._ids)
+        with self._lock:
+            if self._error is not None:
+                future.set_exception(RuntimeError(self._error))
+                return future
+            self._futures[request_id] = future
+        self._requests.put((request_id, kind, list(texts)))
+        return future
+
+    def embed(self, texts: list[str], kind: str = "query") -> list[list[float]]:
+        return self.submit(texts, kind).result()
+
+    async def aembed(self, texts: list[str], kind: str = "query") -> list[list[float]]:
+        return await asyncio.wrap_future(self.submit(texts, kind))
+
+    def _read(self):
+        while True:
+            try:
+                message, payload = self._responses.get(timeout=1)
+            except queue.Empty:
+                if self._process.is_alive():
+                    continue
+                self._fail_pending(f"embedding worker exited ({self._process.exitcode})")
+                return
+            except (EOFError, OSError) as e:
+                self._fail_pending(f"embedding worker unreachable, {e}")
+                return
+            if message == "batch":
+                self.batches += 1
+                self.texts += payload
+                continue
+            request_id, vectors, error = payload
+            with self._lock:
+                future = self._futures.pop(request_id, None)
+            # None or done: the waiter was cancelled, e.g. on client disconnect
+            if future is None or future.done():
+                continue
+            try:
+                if error is not None:
+                    future.set_exception(RuntimeError(error))
+                else:
+                    future.set_result(vectors)
+            except Exception as e:
+                print(f"[ERROR]: embedding result dropped, {e}")
+
+    def _fail_pending(self, reason: str):
+        print(f"[ERROR]: {reason}")
+        with self._lock:
+            self._error = reason
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            if not future.done():
+                try:
+                    future.set_exception(RuntimeError(reason))
+                except Exception:
+                    pass
+
+    def close(self):
+        if self._process.is_alive():
+            self._requests.put(None)
+            self._process.join(timeout=5)
+
+    def stats(self) -> dict:
+        return {
+            "alive": self._process.is_alive(),
+            "pending": len(self._futures),
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_texts": self.texts / self.batches if self.batches else 0.0,
+        }
+
+
+class LocalEmbedding(BaseEmbedding):
+    """Embedding model served by an EmbeddingProcess."""
+
+    _process: EmbeddingProcess = PrivateAttr()
+
+    def __init__(self, process: EmbeddingProcess, model_name: str, **kwargs: Any):
+        super().__init__(model_name=model_name, embed_batch_size=BGE_EMBED_MAX_BATCH, **kwargs)
+        self._process = process
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalEmbedding"
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._process.embed([query], "query")[0]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return (await self._process.aembed([query], "query"))[0]
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._process.embed([text], "text")[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._process.embed(texts, "text")
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return await self._process.aembed(texts, "text")
+
+
+_bge_process = None
+_bge_lock = threading.Lock()
+
+
+def get_bge_process() -> EmbeddingProcess:
+    """Start the local embedding worker once per API process."""
+    global _bge_process
+    with _bge_lock:
+        if _bge_process is None:
+            _bge_process = EmbeddingProcess()
+            atexit.register(_bge_process.close)
+        return _bge_process
+
+
+def embedding_tag(backend: str | None = None) -> str:
+    """Identifies the vector space of the configured backend. Collections
+    carry it in their metadata so vectors of two models are never mixed."""
+    if (backend or EMBEDDING_BACKEND) == "bge":
+        return f"bge:{BGE_EMBED_MODEL}"
+    return f"google:{os.getenv('EMBEDDING_MODEL')}"
+
+
+def check_collection_tag(collection, backend: str | None = None):
+    """Refuse to query or write a collection embedded with another model.
+    Untagged collections predate tagging and hold Google vectors."""
+    backend = backend or EMBEDDING_BACKEND
+    tag = (collection.metadata or {}).get(EMBEDDING_TAG_KEY)
+    expected = embedding_tag(backend)
+    if tag is None and backend == "google":
+        return
+    if tag != expected:
+        raise ValueError(
+            f"Collection {collection.name} holds {tag or 'untagged (google)'} vectors, "
+            f"the configured embedding is {expected}; re-index it first"
+        )
+
+
+def embedding_stats() -> dict:
+    return {
+        "backend": EMBEDDING_BACKEND,
+        "bge": _bge_process.stats() if _bge_process is not None else None,
+        "query_batcher": _query_batcher.stats() if _query_batcher is not None else None,
+    }
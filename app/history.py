@@ -0,0 +1,78 @@
+import os
+from langchain.agents.middleware import AgentMiddleware, SummarizationMiddleware
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HISTORY_COMPACTION_ENABLED = (
+    os.getenv("HISTORY_COMPACTION_ENABLED", "true").lower() == "true"
+)
+# Compact once the thread history exceeds this many tokens
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 8000))
+# Most recent tokens kept verbatim when compacting, older turns are summarized
+HISTORY_KEEP_TOKENS = int(os.getenv("HISTORY_KEEP_TOKENS", 3000))
+# search_vdb outputs of earlier turns are cut to this many tokens
+HISTORY_TOOL_OUTPUT_TOKENS = int(os.getenv("HISTORY_TOOL_OUTPUT_TOKENS", 200))
+
+# Same estimate as count_tokens_approximately
+_CHARS_PER_TOKEN = 4
+TRUNCATED_MARKER = "\n[truncated]"
+
+
+class TruncateToolOutputs(AgentMiddleware):
+    """Cut the tool outputs of previous turns down to a few hundred tokens.
+
+    The agent has already answered from them, so only the gist is worth
+    resending. The shortened messages keep their ids, which makes the state
+    update replace them in the checkpoint instead of appending.
+    """
+
+    def __init__(self, max_tokens: int):
+        super().__init__()
+        self.max_chars = max_tokens * _CHARS_PER_TOKEN
+
+    def before_model(self, state, runtime):
+        messages = state["messages"]
+        # Outputs of the current turn come after the last user message
+        current_turn = max(
+            (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)),
+            default=len(messages),
+        )
+        updates = []
+        for message in messages[:current_turn]:
+            if (
+                isinstance(message, ToolMessage)
+                and isinstance(message.content, str)
+                and len(message.content) > self.max_chars
+                and not message.content.endswith(TRUNCATED_MARKER)
+            ):
+                content = message.content[: self.max_chars] + TRUNCATED_MARKER
+                updates.append(message.model_copy(update={"content": content}))
+        return {"messages": updates} if updates else None
+
+    async def abefore_model(self, state, runtime):
+        return self.before_model(state, runtime)
+
+
+def build_history_middleware(model) -> list[AgentMiddleware]:
+    """Middleware bounding the history sent to the model on long threads.
+
+    Old tool outputs are truncated first. Once the remaining history is over
+    HISTORY_TOKEN_BUDGET, everything but the last HISTORY_KEEP_TOKENS is
+    replaced by a summary message. The previous summary is part of what gets
+    summarized, so the summary is updated incrementally. Both rewrite the
+    persisted state, so later turns start from the compacted history.
+    """
+    if not HISTORY_COMPACTION_ENABLED:
+        return []
+    return [
+        TruncateToolOutputs(HISTORY_TOOL_OUTPUT_TOKENS),
+        SummarizationMiddleware(
+            model=model,
+            trigger=("tokens", HISTORY_TOKEN_BUDGET),
+            keep=("tokens", HISTORY_KEEP_TOKENS),
+            token_counter=count_tokens_approximately,
+        ),
+    ]
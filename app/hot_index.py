@@ -0,0 +1,267 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HOT_INDEX_ENABLED = os.getenv("HOT_INDEX_ENABLED", "true").lower() == "true"
+# Memory budget for all loaded documents (matrices plus chunk texts)
+HOT_INDEX_MAX_BYTES = int(os.getenv("HOT_INDEX_MAX_BYTES", 256 * 1024 * 1024))
+# Documents with more chunks than this are always served by Chroma
+HOT_INDEX_MAX_CHUNKS = int(os.getenv("HOT_INDEX_MAX_CHUNKS", 20000))
+
+
+class DocumentMatrix:
+    """All chunks of one document: a contiguous float32 matrix plus their nodes."""
+
+    def __init__(self, nodes: list, embeddings, space: str = "l2"):
+        self.nodes = nodes
+        self.matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.space = space
+        norms = np.linalg.norm(self.matrix, axis=1)
+        self.sq_norms = norms**2
+        if space == "cosine":
+            self.matrix /= np.where(norms == 0, 1, norms)[:, None]
+        self.nbytes = self.matrix.nbytes + sum(
+            len(node.get_content()) * 2 for node in nodes
+        )
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def search(self, embedding, top_k: int) -> list[NodeWithScore]:
+        query = np.asarray(embedding, dtype=np.float32)
+        dots = self.matrix @ query
+        # Distances follow the collection's metric so scores match Chroma's
+        if self.space == "cosine":
+            distances = 1 - dots / (np.linalg.norm(query) or 1)
+        elif self.space == "ip":
+            distances = 1 - dots
+        else:
+            distances = self.sq_norms - 2 * dots + float(query @ query)
+        k = min(top_k, len(self.nodes))
+        if k == 0:
+            return []
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [
+            NodeWithScore(node=self.nodes[i], score=float(np.exp(-distances[i])))
+            for i in top
+        ]
+
+
+def _collection_space(collection) -> str:
+    space = (collection.metadata or {}).get("hnsw:space")
+    if space is None:
+        try:
+            space = collection.configuration.get("hnsw", {}).get("space")
+        except Exception:
+            space = None
+    return space or "l2"
+
+
+def _to_node(node_id, text, metadata):
+    # Same reconstruction as ChromaVectorStore, with the legacy fallback simplified
+    try:
+        return metadata_dict_to_node(metadata, text=text)
+    except Exception:
+        return TextNode(text=text or "", id_=node_id, metadata=metadata or {})
+
+
+class HotDocumentIndex:
+    """In-process per-document vector index, an LRU bounded by a memory budget.
+
+    A document is loaded from Chroma in the background the first time it is
+    requested; until it is resident, callers keep using Chroma. With
+    partitioned storage `collection_for` maps a document to its collection.
+    """
+
+    def __init__(
+        self,
+        collection=None,
+        max_bytes: int = HOT_INDEX_MAX_BYTES,
+        max_chunks: int = HOT_INDEX_MAX_CHUNKS,
+        collection_for=None,
+    ):
+        self._collection_for = collection_for or (lambda doc_content_hash: collection)
+        self.max_bytes = max_bytes
+        self.max_chunks = max_chunks
+        self.size = 0
+        self._docs = OrderedDict()
+        self._loading = set()
+        self._oversized = set()
+        # Bumped by evict() so a load racing with a re-ingest is discarded
+        self._generations = {}
+        # Bumped by clear(), discards every load in flight
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hot-index")
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, doc_content_hash: str) -> DocumentMatrix | None:
+        """Resident document or None; a miss schedules a background load."""
+        with self._lock:
+            doc = self._docs.get(doc_content_hash)
+            if doc is not None:
+                self._docs.move_to_end(doc_content_hash)
+                self.hits += 1
+                return doc
+            self.misses += 1
+            if doc_content_hash in self._loading or doc_content_hash in self._oversized:
+                return None
+            self._loading.add(doc_content_hash)
+        self._executor.submit(self._load_quietly, doc_content_hash)
+        return None
+
+    def ensure(self, doc_content_hash: str) -> DocumentMatrix | None:
+        """Resident document, loaded now if it is not; None if it does not fit."""
+        with self._lock:
+            doc = self._docs.get(doc_content_hash)
+            if doc is not None:
+                self._docs.move_to_end(doc_content_hash)
+                return doc
+            if doc_content_hash in self._oversized:
+                return None
+        return self.load(doc_content_hash)
+
+    def _load_quietly(self, doc_content_hash: str):
+        try:
+            self.load(doc_content_hash)
+        except Exception as e:
+            print(f"[ERROR]: hot index load {doc_content_hash}, {e}")
+        finally:
+            with self._lock:
+                self._loading.discard(doc_content_hash)
+
+    def load(self, doc_content_hash: str) -> DocumentMatrix | None:
+        started = time.perf_counter()
+        with self._lock:
+            generation = (self._epoch, self._generations.get(doc_content_hash, 0))
+        collection = self._collection_for(doc_content_hash)
+        if collection is None:
+            return None
+        data = collection.get(
+            where={"doc_content_hash": doc_content_hash},
+            include=["embeddings", "documents", "metadatas"],
+            limit=self.max_chunks + 1,
+        )
+        if len(data["ids"]) > self.max_chunks:
+            with self._lock:
+                self._oversized.add(doc_content_hash)
+            return None
+        if not data["ids"]:
+            return None
+        nodes = [
+            _to_node(node_id, text, metadata)
+            for node_id, text, metadata in zip(
+                data["ids"], data["documents"], data["metadatas"]
+            )
+        ]
+        doc = DocumentMatrix(nodes, data["embeddings"], _collection_space(collection))
+        if doc.nbytes > self.max_bytes:
+            with self._lock:
+                self._oversized.add(doc_content_hash)
+            return None
+        with self._lock:
+            if (self._epoch, self._generations.get(doc_content_hash, 0)) != generation:
+                return None
+            old = self._docs.pop(doc_content_hash, None)
+            if old is not None:
+                self.size -= old.nbytes
+            self._docs[doc_content_hash] = doc
+            self.size += doc.nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self._docs.popitem(last=False)
+                self.size -= evicted.nbytes
+                self.evictions += 1
+            self.loads += 1
+        print(
+            f"Hot index loaded {doc_content_hash}: {len(doc)} chunks in "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return doc
+
+    def evict(self, doc_content_hash: str):
+        with self._lock:
+            self._generations[doc_content_hash] = (
+                self._generations.get(doc_content_hash, 0) + 1
+            )
+            doc = self._docs.pop(doc_content_hash, None)
+            if doc is not None:
+                self.size -= doc.nbytes
+            self._oversized.discard(doc_content_hash)
+
+    def clear(self):
+        """Evict every document, e.g. after invalidations may have been missed."""
+        with self._lock:
+            self._epoch += 1
+            self._docs.clear()
+            self.size = 0
+            self._oversized.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "documents": len(self._docs),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+
+class HotDocumentRetriever(BaseRetriever):
+    """Answer from the in-process index when the document is resident, otherwise
+    delegate to the Chroma-backed `fallback` retriever."""
+
+    def __init__(
+        self,
+        hot_index: HotDocumentIndex,
+        doc_content_hash: str,
+        similarity_top_k: int,
+        fallback: BaseRetriever,
+        embed_model,
+    ):
+        super().__init__()
+        self._hot_index = hot_index
+        self._doc_content_hash = doc_content_hash
+        self._similarity_top_k = similarity_top_k
+        self._fallback = fallback
+        self._embed_model = embed_model
+        # "hot" or "chroma", whichever served the last retrieval
+        self.source = None
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        doc = self._hot_index.get(self._doc_content_hash)
+        self.source = "chroma" if doc is None else "hot"
+        if doc is None:
+            return self._fallback.retrieve(query_bundle)
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_query_embedding(
+                query_bundle.query_str
+            )
+        return doc.search(query_bundle.embedding, self._similarity_top_k)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        doc = self._hot_index.get(self._doc_content_hash)
+        self.source = "chroma" if doc is None else "hot"
+        if doc is None:
+            return await self._fallback.aretrieve(query_bundle)
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self._embed_model.aget_query_embedding(
+                query_bundle.query_str
+            )
+        return doc.search(query_bundle.embedding, self._similarity_top_k)
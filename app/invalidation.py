@@ -0,0 +1,98 @@
+import asyncio
+import os
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+from app.cache import CACHE_KEY_PREFIX, CACHE_REDIS_URL
+
+load_dotenv()
+
+INVALIDATION_CHANNEL = f"{CACHE_KEY_PREFIX}:invalidate"
+# Seconds between reconnection attempts of the subscriber
+INVALIDATION_RETRY_S = float(os.getenv("INVALIDATION_RETRY_S", 1))
+
+
+class DocumentInvalidation:
+    """Fans document invalidations out to every API worker over Redis pub/sub.
+
+    Each worker subscribes on startup and runs `on_invalidate(doc_hash)` for
+    every published hash, its own included. Pub/sub does not queue messages
+    for a disconnected subscriber, so `on_resync()` runs every time the
+    subscription is (re)established and must drop everything that could
+    have gone stale in the meantime.
+    """
+
+    def __init__(self, client, on_invalidate, on_resync, channel: str = INVALIDATION_CHANNEL):
+        self._client = client
+        self._on_invalidate = on_invalidate
+        self._on_resync = on_resync
+        self.channel = channel
+        self._task = None
+        self.subscribed = asyncio.Event()
+        self.published = 0
+        self.received = 0
+        self.resyncs = 0
+
+    @classmethod
+    def from_url(cls, redis_url: str | None, on_invalidate, on_resync):
+        """None without Redis: a single process has nothing to fan out to."""
+        if not redis_url:
+            return None
+        return cls(aioredis.from_url(redis_url), on_invalidate, on_resync)
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def publish(self, doc_content_hash: str):
+        await self._client.publish(self.channel, doc_content_hash)
+        self.published += 1
+
+    async def _loop(self):
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ERROR]: invalidation subscriber, {e}")
+            self.subscribed.clear()
+            await asyncio.sleep(INVALIDATION_RETRY_S)
+
+    async def _listen(self):
+        pubsub = self._client.pubsub()
+        try:
+            await pubsub.subscribe(self.channel)
+            # Messages published while unsubscribed are lost
+            self._on_resync()
+            self.resyncs += 1
+            self.subscribed.set()
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = message["data"]
+                self.received += 1
+                self._on_invalidate(data.decode() if isinstance(data, bytes) else data)
+        finally:
+            await pubsub.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "subscribed": self.subscribed.is_set(),
+            "published": self.published,
+            "received": self.received,
+            "resyncs": self.resyncs,
+        }
+
+
+def start_document_invalidation(on_invalidate, on_resync, redis_url: str | None = CACHE_REDIS_URL):
+    invalidation = DocumentInvalidation.from_url(redis_url, on_invalidate, on_resync)
+    if invalidation is not None:
+        invalidation.start()
+    return invalidation
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds, tuned for stages ranging from in-memory lookups to LLM calls
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class Histogram:
+    """Minimal Prometheus histogram: an observation is a bisect plus three
+    additions under a lock, cheap enough for every call on the hot path."""
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # sorted label items -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = [f'{k}="{v}"' for k, v in key]
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+stage_seconds = Histogram(
+    "qa_stage_seconds",
+    "Latency of each stage of a /chat request (embedding, retrieve, rerank, "
+    "synthesis, ttft, checkpoint, request, startup, warmup, retention, "
+    "embedding_batch_wait)",
+)
+
+# Items per call of the request coalescers, labelled by batcher
+batch_size = Histogram(
+    "qa_batch_size",
+    "Items sent in one batched backend call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+# Spans of the request being served, None outside a traced request
+_current_trace: ContextVar[list | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """Time a stage into `stage_seconds` and the current request trace.
+
+    Yields the labels dict so the body can fill in labels only known at the
+    end, e.g. `labels["cache"] = "hit"`.
+    """
+    started = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append({"stage": stage, "ms": round(elapsed * 1000, 2), **labels})
+
+
+def observe(stage: str, seconds: float, **labels):
+    """Record a stage measured by the caller (e.g. time to first token)."""
+    stage_seconds.observe(seconds, stage=stage, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append({"stage": stage, "ms": round(seconds * 1000, 2), **labels})
+
+
+@contextmanager
+def request_trace(**fields):
+    """Collect every span of one request and log them as a single JSON line."""
+    trace = []
+    _current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        # set() rather than reset(): an async generator may be closed from
+        # a different context than the one that entered it
+        _current_trace.set(None)
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage="request")
+        record = {
+            "event": "request",
+            **fields,
+            "ms": round(elapsed * 1000, 2),
+            "spans": trace,
+        }
+        print(json.dumps(record, ensure_ascii=False))
+
+
+def render_stats(prefix: str, stats) -> list[str]:
+    """Expose a nested stats dict of numbers as Prometheus gauges."""
+    lines = []
+    if isinstance(stats, dict):
+        for key, value in stats.items():
+            lines += render_stats(f"{prefix}_{key}", value)
+    elif isinstance(stats, bool):
+        lines.append(f"{prefix} {int(stats)}")
+    elif isinstance(stats, (int, float)):
+        lines.append(f"{prefix} {stats}")
+    return lines
+
+
+def render(stats: dict) -> str:
+    lines = stage_seconds.render() + batch_size.render()
+    for name, value in stats.items():
+        lines += render_stats(f"qa_{name}", value)
+    return "\n".join(lines) + "\n"
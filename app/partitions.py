@@ -0,0 +1,131 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from chromadb.errors import NotFoundError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "single": every document in CHROMA_COLLECTION_NAME
+# "bucket": documents hashed into CHROMA_PARTITION_BUCKETS collections
+# "document": one collection per document
+CHROMA_PARTITION_MODE = os.getenv("CHROMA_PARTITION_MODE", "single")
+CHROMA_PARTITION_BUCKETS = int(os.getenv("CHROMA_PARTITION_BUCKETS", 64))
+# Open collection handles kept per process
+CHROMA_PARTITION_CACHE_SIZE = int(os.getenv("CHROMA_PARTITION_CACHE_SIZE", 256))
+
+PARTITION_MODES = ("single", "bucket", "document")
+
+# Chroma names: 3-512 characters from [a-zA-Z0-9._-], alphanumeric at both ends
+_UNSAFE = re.compile(r"[^a-zA-Z0-9_-]")
+
+
+def partition_name(
+    base: str,
+    doc_content_hash: str,
+    mode: str = CHROMA_PARTITION_MODE,
+    buckets: int = CHROMA_PARTITION_BUCKETS,
+) -> str:
+    """Collection holding a document. Stable across processes and restarts,
+    ingestion and retrieval must agree on it."""
+    if mode == "single":
+        return base
+    if mode == "bucket":
+        digest = hashlib.sha256(doc_content_hash.encode("utf-8")).digest()
+        return f"{base}-b{int.from_bytes(digest[:8], 'big') % buckets:04d}"
+    if mode == "document":
+        safe = _UNSAFE.sub("_", doc_content_hash)[:400].strip("_")
+        if not safe:
+            raise ValueError(f"Cannot derive a collection name from {doc_content_hash!r}")
+        return f"{base}-d-{safe}"
+    raise ValueError(f"Unknown partition mode {mode!r}, expected one of {PARTITION_MODES}")
+
+
+class PartitionRouter:
+    """Maps a doc_content_hash to its Chroma collection, an LRU of open handles.
+
+    Reads use `get`, which never creates a collection: a hash that was never
+    ingested must not leave an empty partition behind. Ingestion and the
+    migration write through `get_or_create`, which creates partitions with
+    `metadata` (embedding tag, distance settings). `on_open` vets every newly
+    opened handle (e.g. its embedding tag) before it is cached.
+    """
+
+    def __init__(
+        self,
+        client,
+        base_name: str,
+        mode: str = CHROMA_PARTITION_MODE,
+        buckets: int = CHROMA_PARTITION_BUCKETS,
+        max_open: int = CHROMA_PARTITION_CACHE_SIZE,
+        metadata: dict | None = None,
+        on_open=None,
+    ):
+        if mode not in PARTITION_MODES:
+            raise ValueError(f"Unknown partition mode {mode!r}, expected one of {PARTITION_MODES}")
+        self.client = client
+        self.base_name = base_name
+        self.mode = mode
+        self.buckets = buckets
+        self.max_open = max_open
+        self.metadata = metadata or None
+        self._on_open = on_open
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.opens = 0
+        self.evictions = 0
+        self.missing = 0
+
+    def name_for(self, doc_content_hash: str) -> str:
+        return partition_name(self.base_name, doc_content_hash, self.mode, self.buckets)
+
+    def get(self, doc_content_hash: str):
+        """Collection holding the document, None if its partition does not exist."""
+        return self._open_partition(doc_content_hash, create=False)
+
+    def get_or_create(self, doc_content_hash: str):
+        return self._open_partition(doc_content_hash, create=True)
+
+    def _open_partition(self, doc_content_hash: str, create: bool):
+        name = self.name_for(doc_content_hash)
+        with self._lock:
+            collection = self._open.get(name)
+            if collection is not None:
+                self._open.move_to_end(name)
+                self.hits += 1
+                return collection
+        # Opened outside the lock, a racing open of the same name is harmless
+        if create:
+            collection = self.client.get_or_create_collection(name, metadata=self.metadata)
+        else:
+            try:
+                collection = self.client.get_collection(name)
+            except NotFoundError:
+                # Not cached, so a partition ingested later is picked up
+                self.missing += 1
+                return None
+        if self._on_open is not None:
+            self._on_open(collection)
+        with self._lock:
+            self._open[name] = collection
+            self._open.move_to_end(name)
+            self.opens += 1
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+                self.evictions += 1
+        return collection
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "buckets": self.buckets if self.mode == "bucket" else None,
+            "open": len(self._open),
+            "max_open": self.max_open,
+            "hits": self.hits,
+            "opens": self.opens,
+            "evictions": self.evictions,
+            "missing": self.missing,
+        }
@@ -0,0 +1,74 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Opt-in: start retrieval for the user input as soon as /chat receives it
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+
+
+class Prefetcher:
+    """Speculative work started before anyone asks for it.
+
+    A request `start`s the work for a key and `release`s it when it ends;
+    a consumer that needs the result in between `take`s the running task
+    instead of redoing the work. Work released without being taken counts as
+    wasted and is cancelled if still running. Concurrent requests for the
+    same key share one task.
+    """
+
+    def __init__(self):
+        # key -> [task, owners, taken]
+        self._entries = {}
+        self.started = 0
+        self.shared = 0
+        self.hits = 0
+        self.wasted = 0
+
+    def start(self, key, coro_fn):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.started += 1
+            task = asyncio.ensure_future(coro_fn())
+            # Errors surface to the consumer, or are dropped with the task
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._entries[key] = [task, 1, False]
+        else:
+            self.shared += 1
+            entry[1] += 1
+
+    def take(self, key) -> asyncio.Task | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not entry[2]:
+            self.hits += 1
+            entry[2] = True
+        return entry[0]
+
+    def release(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del self._entries[key]
+        task, _, taken = entry
+        if not taken:
+            self.wasted += 1
+            task.cancel()
+
+    def stats(self) -> dict:
+        finished = self.hits + self.wasted
+        return {
+            "enabled": PREFETCH_ENABLED,
+            "in_flight": len(self._entries),
+            "started": self.started,
+            "shared": self.shared,
+            "hits": self.hits,
+            "wasted": self.wasted,
+            "hit_rate": self.hits / finished if finished else 0.0,
+            "wasted_rate": self.wasted / finished if finished else 0.0,
+        }
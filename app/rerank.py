@@ -0,0 +1,208 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.postprocessor.cohere_rerank import CohereRerank
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "cohere" (remote API) or "bge" (local FlagEmbedding cross-encoder on CPU)
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "cohere")
+BGE_RERANK_MODEL = os.getenv("BGE_RERANK_MODEL", "BAAI/bge-reranker-v2-m3")
+# Worker threads sharing the local model, each scores one batch at a time
+BGE_RERANK_WORKERS = int(os.getenv("BGE_RERANK_WORKERS", 1))
+# Upper bound of (query, passage) pairs scored in one forward pass
+BGE_RERANK_MAX_BATCH = int(os.getenv("BGE_RERANK_MAX_BATCH", 64))
+# How long a worker waits for more concurrent requests before scoring a batch
+BGE_RERANK_WAIT_MS = float(os.getenv("BGE_RERANK_WAIT_MS", 5))
+
+
+class RerankWorker:
+    """Scores (query, passage) pairs with a cross-encoder on background threads.
+
+    Requests submitted concurrently are merged into a single `compute_score`
+    call of up to `max_batch` pairs, so the model runs a few large forward
+    passes instead of one small pass per request.
+    """
+
+    def __init__(
+        self,
+        score_fn,
+        workers: int = BGE_RERANK_WORKERS,
+        max_batch: int = BGE_RERANK_MAX_BATCH,
+        wait_ms: float = BGE_RERANK_WAIT_MS,
+    ):
+        self._score_fn = score_fn
+        self._max_batch = max_batch
+        self._wait = wait_ms / 1000
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.pairs = 0
+        for i in range(workers):
+            threading.Thread(
+                target=self._run, name=f"rerank-worker-{i}", daemon=True
+            ).start()
+
+    def submit(self, pairs: list[tuple[str, str]]) -> Future:
+        future = Future()
+        if not pairs:
+            future.set_result([])
+        else:
+            self._queue.put((pairs, future))
+        return future
+
+    def score(self, pairs: list[tuple[str, str]]) -> list[float]:
+        return self.submit(pairs).result()
+
+    async def ascore(self, pairs: list[tuple[str, str]]) -> list[float]:
+        return await asyncio.wrap_future(self.submit(pairs))
+
+    def _collect(self) -> list:
+        jobs = [self._queue.get()]
+        size = len(jobs[0][0])
+        deadline = time.monotonic() + self._wait
+        while size < self._max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            jobs.append(job)
+            size += len(job[0])
+        return jobs
+
+    def _run(self):
+        while True:
+            # Requests cancelled while queued (client gone) are not scored;
+            # the others can no longer be cancelled once running
+            jobs = [
+                (job_pairs, future)
+                for job_pairs, future in self._collect()
+                if future.set_running_or_notify_cancel()
+            ]
+            if not jobs:
+                continue
+            pairs = [pair for job_pairs, _ in jobs for pair in job_pairs]
+            try:
+                scores = self._score_fn(pairs)
+            except Exception as e:
+                for _, future in jobs:
+                    _settle(future, exception=e)
+                continue
+            self.batches += 1
+            self.pairs += len(pairs)
+            offset = 0
+            for job_pairs, future in jobs:
+                _settle(future, result=scores[offset : offset + len(job_pairs)])
+                offset += len(job_pairs)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "pairs": self.pairs,
+            "avg_batch_pairs": self.pairs / self.batches if self.batches else 0.0,
+        }
+
+
+def _settle(future: Future, result=None, exception=None):
+    # A worker thread must survive a future it can no longer complete
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except Exception as e:
+        print(f"[ERROR]: rerank result dropped, {e}")
+
+
+class WorkerRerank(BaseNodePostprocessor):
+    """Node postprocessor that reranks through a shared RerankWorker."""
+
+    top_n: int = Field(description="Top N nodes to return.")
+    _worker: RerankWorker = PrivateAttr()
+
+    def __init__(self, worker: RerankWorker, top_n: int):
+        super().__init__(top_n=top_n)
+        self._worker = worker
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "WorkerRerank"
+
+    @staticmethod
+    def _pairs(nodes, query_bundle) -> list[tuple[str, str]]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        query = query_bundle.query_str
+        return [
+            (query, node.node.get_content(metadata_mode=MetadataMode.EMBED))
+            for node in nodes
+        ]
+
+    def _top(self, nodes, scores) -> list[NodeWithScore]:
+        ranked = [
+            NodeWithScore(node=node.node, score=float(score))
+            for node, score in zip(nodes, scores)
+        ]
+        ranked.sort(key=lambda n: n.score, reverse=True)
+        return ranked[: self.top_n]
+
+    def _postprocess_nodes(self, nodes, query_bundle=None) -> list[NodeWithScore]:
+        return self._top(nodes, self._worker.score(self._pairs(nodes, query_bundle)))
+
+    async def _apostprocess_nodes(self, nodes, query_bundle=None) -> list[NodeWithScore]:
+        scores = await self._worker.ascore(self._pairs(nodes, query_bundle))
+        return self._top(nodes, scores)
+
+
+_bge_worker = None
+_bge_lock = threading.Lock()
+
+
+def get_bge_worker() -> RerankWorker:
+    """Load the BGE cross-encoder once per process and start its workers."""
+    global _bge_worker
+    with _bge_lock:
+        if _bge_worker is None:
+            # Imported lazily, FlagEmbedding pulls in torch
+            from FlagEmbedding import FlagReranker
+
+            model = FlagReranker(BGE_RERANK_MODEL, use_fp16=False, devices="cpu")
+
+            def score(pairs):
+                scores = model.compute_score(pairs, normalize=True)
+                # A single pair comes back as a bare float
+                return scores if isinstance(scores, list) else [scores]
+
+            _bge_worker = RerankWorker(score)
+        return _bge_worker
+
+
+@lru_cache(maxsize=None)
+def get_reranker(top_n: int, backend: str = RERANK_BACKEND) -> BaseNodePostprocessor:
+    """Reranker for the configured backend, one shared instance per (top_n, backend)."""
+    if backend == "bge":
+        return WorkerRerank(get_bge_worker(), top_n=top_n)
+    if backend == "cohere":
+        return CohereRerank(
+            api_key=os.getenv("COHERE_API_KEY"),
+            top_n=top_n,
+            model=os.getenv("RERANK_MODEL"),
+        )
+    raise ValueError(f"Unknown RERANK_BACKEND: {backend}")
+
+
+def rerank_stats() -> dict:
+    return {
+        "backend": RERANK_BACKEND,
+        "bge": _bge_worker.stats() if _bge_worker is not None else None,
+    }
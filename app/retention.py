@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from app.metrics import observe
+
+load_dotenv()
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "true").lower() == "true"
+# Checkpoints kept per thread (and namespace), older ones are deleted
+RETENTION_KEEP_CHECKPOINTS = int(os.getenv("RETENTION_KEEP_CHECKPOINTS", 20))
+# Threads without a new checkpoint for this long are deleted entirely
+RETENTION_THREAD_TTL_DAYS = float(os.getenv("RETENTION_THREAD_TTL_DAYS", 30))
+# Seconds between two collection passes
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 600))
+# Threads handled per delete transaction
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+# Pause between batches, keeps the collector from competing with live traffic
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", 0.5))
+
+# Only one API process collects at a time
+_ADVISORY_LOCK_ID = 0x71615F6763  # "qa_gc"
+
+# Threads and namespaces are located through checkpoint->>'ts', the ISO-8601
+# UTC write time, which sorts correctly as text
+_SETUP = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS checkpoints_ts_idx
+ON checkpoints ((checkpoint->>'ts'))
+"""
+
+_IDLE_THREADS = """
+SELECT DISTINCT c.thread_id FROM checkpoints c
+WHERE c.checkpoint->>'ts' < %(cutoff)s
+AND NOT EXISTS (
+    SELECT 1 FROM checkpoints n
+    WHERE n.thread_id = c.thread_id AND n.checkpoint->>'ts' >= %(cutoff)s
+)
+LIMIT %(limit)s
+"""
+
+# Threads written since the previous pass are the only ones that can have
+# grown past the limit, paged by thread_id
+_ACTIVE_THREADS = """
+SELECT DISTINCT thread_id FROM checkpoints
+WHERE checkpoint->>'ts' >= %(since)s AND thread_id > %(after)s
+ORDER BY thread_id
+LIMIT %(limit)s
+"""
+
+_TABLES = ("checkpoints", "checkpoint_writes", "checkpoint_blobs")
+
+# (table, statement) pairs, run in one transaction per batch
+_DELETE_THREADS = tuple(
+    (table, f"DELETE FROM {table} WHERE thread_id = ANY(%(threads)s)")
+    for table in _TABLES
+)
+
+_PRUNE_THREADS = (
+    ("checkpoints", """
+    DELETE FROM checkpoints c USING (
+        SELECT thread_id, checkpoint_ns, checkpoint_id FROM (
+            SELECT thread_id, checkpoint_ns, checkpoint_id, row_number() OVER (
+                PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+            ) AS rn
+            FROM checkpoints WHERE thread_id = ANY(%(threads)s)
+        ) ranked
+        WHERE rn > %(keep)s
+    ) old
+    WHERE c.thread_id = old.thread_id
+    AND c.checkpoint_ns = old.checkpoint_ns
+    AND c.checkpoint_id = old.checkpoint_id
+    """),
+    # Pending writes of the deleted checkpoints
+    ("checkpoint_writes", """
+    DELETE FROM checkpoint_writes w
+    WHERE w.thread_id = ANY(%(threads)s)
+    AND NOT EXISTS (
+        SELECT 1 FROM checkpoints c
+        WHERE c.thread_id = w.thread_id
+        AND c.checkpoint_ns = w.checkpoint_ns
+        AND c.checkpoint_id = w.checkpoint_id
+    )
+    """),
+    # Channel values no remaining checkpoint points to
+    ("checkpoint_blobs", """
+    DELETE FROM checkpoint_blobs b
+    WHERE b.thread_id = ANY(%(threads)s)
+    AND NOT EXISTS (
+        SELECT 1 FROM checkpoints c
+        WHERE c.thread_id = b.thread_id
+        AND c.checkpoint_ns = b.checkpoint_ns
+        AND c.checkpoint->'channel_versions'->>b.channel = b.version
+    )
+    """),
+)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+class CheckpointRetention:
+    """Background garbage collector for the langgraph postgres checkpoint tables.
+
+    Each pass deletes threads idle for longer than the TTL, then trims the
+    threads written since the previous pass to their last N checkpoints along
+    with the writes and blobs only the deleted checkpoints referenced. Work is
+    done in batches of threads, one transaction each, with a pause in between.
+    """
+
+    def __init__(
+        self,
+        pool,
+        keep: int = RETENTION_KEEP_CHECKPOINTS,
+        ttl_days: float = RETENTION_THREAD_TTL_DAYS,
+        interval: float = RETENTION_INTERVAL,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        batch_pause: float = RETENTION_BATCH_PAUSE,
+    ):
+        self.pool = pool
+        self.keep = keep
+        self.ttl = timedelta(days=ttl_days)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        # Start of the previous pass, every thread is checked on the first one
+        self._since = _iso(datetime.fromtimestamp(0, timezone.utc))
+        self._task = None
+        self._stats = {
+            "passes": 0,
+            "threads_expired": 0,
+            "threads_trimmed": 0,
+            "rows_deleted": {table: 0 for table in _TABLES},
+            "last_pass_seconds": None,
+            "last_pass_at": None,
+            "errors": 0,
+        }
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def setup(self):
+        async with self.pool.connection() as conn:
+            await conn.execute(_SETUP)
+
+    async def _loop(self):
+        try:
+            await self.setup()
+        except Exception as e:
+            print(f"[ERROR]: retention setup, {e}")
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"[ERROR]: retention, {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> dict | None:
+        """Run one collection pass, returns its report or None when another
+        process holds the collector lock."""
+        async with self.pool.connection() as lock_conn:
+            locked = await (
+                await lock_conn.execute(
+                    "SELECT pg_try_advisory_lock(%s) AS locked", (_ADVISORY_LOCK_ID,)
+                )
+            ).fetchone()
+            if not locked["locked"]:
+                return None
+            try:
+                return await self._collect()
+            finally:
+                await lock_conn.execute("SELECT pg_advisory_unlock(%s)", (_ADVISORY_LOCK_ID,))
+
+    async def _collect(self) -> dict:
+        started = time.perf_counter()
+        pass_started = _iso(datetime.now(timezone.utc))
+        report = {
+            "event": "retention",
+            "threads_expired": 0,
+            "threads_trimmed": 0,
+            "rows_deleted": {table: 0 for table in _TABLES},
+        }
+
+        cutoff = _iso(datetime.now(timezone.utc) - self.ttl)
+        while True:
+            threads = await self._threads(_IDLE_THREADS, cutoff=cutoff)
+            if not threads:
+                break
+            await self._delete(_DELETE_THREADS, threads, report)
+            report["threads_expired"] += len(threads)
+            if len(threads) < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+
+        after = ""
+        while True:
+            threads = await self._threads(_ACTIVE_THREADS, since=self._since, after=after)
+            if not threads:
+                break
+            await self._delete(_PRUNE_THREADS, threads, report)
+            report["threads_trimmed"] += len(threads)
+            after = threads[-1]
+            if len(threads) < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+
+        self._since = pass_started
+        elapsed = time.perf_counter() - started
+        report["seconds"] = round(elapsed, 3)
+        observe("retention", elapsed)
+        self._record(report, pass_started)
+        print(json.dumps(report))
+        return report
+
+    async def _threads(self, query: str, **params) -> list[str]:
+        async with self.pool.connection() as conn:
+            rows = await (
+                await conn.execute(query, {**params, "limit": self.batch_size})
+            ).fetchall()
+        return [row["thread_id"] for row in rows]
+
+    async def _delete(self, statements, threads: list[str], report: dict):
+        params = {"threads": threads, "keep": self.keep}
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                for table, statement in statements:
+                    cursor = await conn.execute(statement, params)
+                    report["rows_deleted"][table] += cursor.rowcount
+
+    def _record(self, report: dict, pass_started: str):
+        self._stats["passes"] += 1
+        self._stats["threads_expired"] += report["threads_expired"]
+        self._stats["threads_trimmed"] += report["threads_trimmed"]
+        for table, rows in report["rows_deleted"].items():
+            self._stats["rows_deleted"][table] += rows
+        self._stats["last_pass_seconds"] = report["seconds"]
+        self._stats["last_pass_at"] = pass_started
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "rows_deleted": dict(self._stats["rows_deleted"]),
+            "keep": self.keep,
+            "ttl_days": self.ttl.total_seconds() / 86400,
+        }
+
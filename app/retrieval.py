@@ -0,0 +1,476 @@
+import asyncio
+import os
+import chromadb
+from llama_index.core import QueryBundle, VectorStoreIndex, get_response_synthesizer
+from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
+from llama_index.core.retrievers import VectorIndexRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+from llama_index.core.utils import get_tokenizer
+from llama_index.core.vector_stores import (
+    MetadataFilter,
+    MetadataFilters,
+)
+from llama_index.llms.google_genai import GoogleGenAI
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from dotenv import load_dotenv
+from app.cache import get_answer_cache, normalize_query
+from app.embeddings import (
+    EMBEDDING_TAG_KEY,
+    build_embed_model,
+    check_collection_tag,
+    embedding_tag,
+)
+from app.hot_index import HOT_INDEX_ENABLED, HotDocumentIndex, HotDocumentRetriever
+from app.metrics import span
+from app.partitions import CHROMA_PARTITION_MODE, PartitionRouter
+from app.prefetch import PREFETCH_ENABLED, Prefetcher
+from app.rerank import RERANK_BACKEND, get_reranker
+from app.singleflight import SingleFlight
+
+load_dotenv()
+
+AGENT_MODEL = os.getenv("AGENT_MODEL")
+TOOL_NAME = "search_vdb"
+# "answer": synthesize an answer from the reranked chunks with a second LLM pass
+# "context": return the reranked chunks and let the agent model write the answer
+SEARCH_VDB_MODE = os.getenv("SEARCH_VDB_MODE", "answer")
+# Token budget of the packed chunks returned in context mode
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+
+# Two-stage retrieval: fetch more candidates, then rerank
+SIMILARITY_TOP_K = 10
+RERANK_TOP_N = 4
+
+# Metadata keys shown as the source of a chunk in context mode, when present
+_SOURCE_KEYS = ("file_name", "title", "page_label")
+
+NO_CONTEXT = "No relevant context found in the document."
+
+# Identical searches in flight at the same time run once
+single_flight = SingleFlight()
+# Retrieval started by /chat before the model calls search_vdb
+prefetcher = Prefetcher()
+
+
+class _AsyncChromaVectorStore(ChromaVectorStore):
+    """ChromaVectorStore whose async query runs off the event loop.
+
+    The chroma integration falls back to the blocking HTTP query in `aquery`,
+    which would stall every other coroutine while the request is in flight.
+    """
+
+    async def aquery(self, query, **kwargs):
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+
+def _connect_client():
+    return chromadb.HttpClient(host=os.getenv("CHROMA_HOST"), port=os.getenv("CHROMA_PORT"))
+
+
+def _connect_collection():
+    collection = _connect_client().get_or_create_collection(os.getenv("CHROMA_COLLECTION_NAME"))
+    check_collection_tag(collection)
+    return collection
+
+
+def _connect_router():
+    # Partitions are named after CHROMA_COLLECTION_NAME and tagged on creation
+    return PartitionRouter(
+        _connect_client(),
+        os.getenv("CHROMA_COLLECTION_NAME"),
+        metadata={EMBEDDING_TAG_KEY: embedding_tag()},
+        on_open=check_collection_tag,
+    )
+
+
+def _connect_storage():
+    """(collection, None) in single-collection mode, (None, router) otherwise."""
+    if CHROMA_PARTITION_MODE == "single":
+        return _connect_collection(), None
+    return None, _connect_router()
+
+
+# Counts the synthesizer's LLM tokens, used to compare the two search modes
+token_counter = TokenCountingHandler()
+
+_vector_store = None
+# Partitioned storage: doc_content_hash -> collection, None with a single collection
+router = None
+# Per-document in-memory vectors, Chroma still serves documents not loaded yet
+hot_index = None
+_index = None
+_embed_model = None
+_llm = None
+_response_synthesizer = None
+_reranker = None
+
+
+def init(collection=None, embed_model=None, llm=None, reranker=None, partitions=None):
+    """Build the retrieval pipeline. Every argument defaults to the production
+    service (Chroma over HTTP, Google embedding and LLM, configured reranker);
+    benchmarks pass local stand-ins instead. `partitions` is a PartitionRouter
+    that replaces the single collection."""
+    global _vector_store, hot_index, _index, _embed_model, _llm, _response_synthesizer
+    global _reranker, router
+
+    if collection is None and partitions is None:
+        collection, partitions = _connect_storage()
+    _embed_model = embed_model or build_embed_model()
+    router = partitions
+    if router is not None:
+        # Indexes are built per query over the routed collection
+        _vector_store = _index = None
+        hot_index = (
+            HotDocumentIndex(collection_for=router.get) if HOT_INDEX_ENABLED else None
+        )
+    else:
+        _vector_store = _AsyncChromaVectorStore(chroma_collection=collection)
+        hot_index = HotDocumentIndex(collection) if HOT_INDEX_ENABLED else None
+        _index = VectorStoreIndex.from_vector_store(
+            vector_store=_vector_store,
+            embed_model=_embed_model,
+        )
+    _llm = llm or GoogleGenAI(model=AGENT_MODEL)
+    _response_synthesizer = get_response_synthesizer(
+        llm=_llm,
+        callback_manager=CallbackManager([token_counter]),
+    )
+    _reranker = reranker or get_reranker(top_n=RERANK_TOP_N)
+
+
+async def ainit():
+    """`init` with the production clients connected concurrently, each in a
+    thread since their constructors block on network I/O. No-op when already
+    initialized (e.g. with local stand-ins by a benchmark)."""
+    if _embed_model is not None:
+        return
+
+    async def timed(component, fn, *args):
+        with span("startup", component=component):
+            return await asyncio.to_thread(fn, *args)
+
+    (collection, partitions), embed_model, llm, reranker = await asyncio.gather(
+        timed("chroma", _connect_storage),
+        timed("embedding", build_embed_model),
+        timed("synthesizer", lambda: GoogleGenAI(model=AGENT_MODEL)),
+        timed("rerank", get_reranker, RERANK_TOP_N),
+    )
+    init(
+        collection=collection,
+        embed_model=embed_model,
+        llm=llm,
+        reranker=reranker,
+        partitions=partitions,
+    )
+
+
+async def awarm_up():
+    """Make one small call through every client so the first user request does
+    not pay for connection setup, tokenizer download or model loading.
+    Failures are logged only: the request path retries on its own."""
+    query = QueryBundle("warm-up")
+
+    async def embedding():
+        query.embedding = await _embed_model.aget_query_embedding(query.query_str)
+
+    async def rerank():
+        nodes = [NodeWithScore(node=TextNode(text="warm-up"), score=0.0)]
+        await _reranker.apostprocess_nodes(nodes, query)
+
+    async def synthesizer():
+        await _llm.acomplete("Reply with OK.")
+
+    async def tokenizer():
+        await asyncio.to_thread(get_tokenizer)
+
+    async def timed(component, fn):
+        try:
+            with span("warmup", component=component):
+                await fn()
+        except Exception as e:
+            print(f"[ERROR]: warm-up {component}, {e}")
+
+    await asyncio.gather(
+        timed("embedding", embedding),
+        timed("rerank", rerank),
+        timed("synthesizer", synthesizer),
+        timed("tokenizer", tokenizer),
+    )
+
+
+def _ensure_index():
+    # Lazy initialization on the first search
+    if _embed_model is None:
+        init()
+
+
+def _index_for(doc_content_hash: str):
+    """Index to search for the document, None when its partition does not exist."""
+    if router is None:
+        return _index
+    collection = router.get(doc_content_hash)
+    if collection is None:
+        return None
+    # Cheap wrappers over the cached collection handle, no I/O
+    vector_store = _AsyncChromaVectorStore(chroma_collection=collection)
+    return VectorStoreIndex.from_vector_store(
+        vector_store=vector_store, embed_model=_embed_model
+    )
+
+
+def evict_document(doc_content_hash: str):
+    """Drop in-process state of a re-ingested document."""
+    if hot_index is not None:
+        hot_index.evict(doc_content_hash)
+
+
+def evict_all_documents():
+    if hot_index is not None:
+        hot_index.clear()
+
+
+async def aprepare_document(doc_content_hash: str):
+    """Open the document's partition and load it into the hot index up front,
+    so a batch of questions on it shares one resident index instead of each
+    search falling back to Chroma until the background load finishes."""
+    _ensure_index()
+
+    def prepare():
+        if router is not None:
+            router.get(doc_content_hash)
+        if hot_index is not None:
+            hot_index.ensure(doc_content_hash)
+
+    with span("prepare_document", tool=TOOL_NAME):
+        await asyncio.to_thread(prepare)
+
+
+def _build_retriever(
+    doc_content_hash: str,
+    similarity_top_k: int = SIMILARITY_TOP_K,
+    use_hot_index: bool = True,
+):
+    """Retriever for the document, None when nothing was ingested for it."""
+    index = _index_for(doc_content_hash)
+    if index is None:
+        return None
+    # Dynamic filters (cannot be cached), still needed when a bucket
+    # partition holds several documents
+    filters = MetadataFilters(
+        filters=[
+            MetadataFilter(
+                key="doc_content_hash",
+                value=doc_content_hash,
+            )
+        ]
+    )
+    retriever = VectorIndexRetriever(
+        index=index, similarity_top_k=similarity_top_k, filters=filters
+    )
+    if hot_index is not None and use_hot_index:
+        retriever = HotDocumentRetriever(
+            hot_index,
+            doc_content_hash,
+            similarity_top_k,
+            fallback=retriever,
+            embed_model=_embed_model,
+        )
+    return retriever
+
+
+def pack_context(nodes: list[NodeWithScore], token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Format reranked chunks with their source metadata, best first, stopping
+    before the token budget is exceeded. The top chunk is truncated rather than
+    dropped if it alone is over budget."""
+    if not nodes:
+        return NO_CONTEXT
+    tokenizer = get_tokenizer()
+    blocks, used = [], 0
+    for i, node in enumerate(nodes, start=1):
+        metadata = node.node.metadata or {}
+        source = ", ".join(f"{k}: {metadata[k]}" for k in _SOURCE_KEYS if k in metadata)
+        header = f"[{i}] (score: {node.score or 0:.3f}{', ' + source if source else ''})"
+        text = node.node.get_content().strip()
+        cost = len(tokenizer(header)) + len(tokenizer(text))
+        if used + cost > token_budget:
+            if blocks:
+                break
+            text = _truncate(text, token_budget - len(tokenizer(header)))
+            cost = token_budget
+        blocks.append(f"{header}\n{text}")
+        used += cost
+    return "\n\n".join(blocks)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    tokenizer = get_tokenizer()
+    if max_tokens <= 0:
+        return ""
+    # Tokenizer has no decode here, so cut by characters proportionally
+    ratio = max_tokens / max(len(tokenizer(text)), 1)
+    return text[: int(len(text) * ratio)]
+
+
+def _retrieve_source(retriever) -> str:
+    return getattr(retriever, "source", None) or "chroma"
+
+
+def retrieve(
+    query_bundle: QueryBundle,
+    doc_content_hash: str,
+    similarity_top_k: int = SIMILARITY_TOP_K,
+    reranker=None,
+    use_hot_index: bool = True,
+) -> list[NodeWithScore]:
+    """Vector search then rerank, the retrieval half of `search`. The keyword
+    arguments let the evaluation harness sweep settings."""
+    _ensure_index()
+    reranker = reranker or _reranker
+    retriever = _build_retriever(doc_content_hash, similarity_top_k, use_hot_index)
+    if retriever is None:
+        return []
+    with span("retrieve", tool=TOOL_NAME) as labels:
+        nodes = retriever.retrieve(query_bundle)
+        labels["source"] = _retrieve_source(retriever)
+    with span("rerank", tool=TOOL_NAME, model=RERANK_BACKEND):
+        return reranker.postprocess_nodes(nodes, query_bundle)
+
+
+async def aretrieve(
+    query_bundle: QueryBundle,
+    doc_content_hash: str,
+    similarity_top_k: int = SIMILARITY_TOP_K,
+    reranker=None,
+    use_hot_index: bool = True,
+) -> list[NodeWithScore]:
+    """Async `retrieve`."""
+    _ensure_index()
+    reranker = reranker or _reranker
+    retriever = _build_retriever(doc_content_hash, similarity_top_k, use_hot_index)
+    if retriever is None:
+        return []
+    with span("retrieve", tool=TOOL_NAME) as labels:
+        nodes = await retriever.aretrieve(query_bundle)
+        labels["source"] = _retrieve_source(retriever)
+    with span("rerank", tool=TOOL_NAME, model=RERANK_BACKEND):
+        return await reranker.apostprocess_nodes(nodes, query_bundle)
+
+
+def _flight_key(query: str, doc_content_hash: str, mode: str) -> tuple:
+    # Everything that changes the result of a search
+    return (
+        doc_content_hash,
+        normalize_query(query),
+        mode,
+        SIMILARITY_TOP_K,
+        RERANK_TOP_N,
+        RERANK_BACKEND,
+    )
+
+
+def search(query: str, doc_content_hash: str, mode: str = SEARCH_VDB_MODE) -> str:
+    """Run the retrieval pipeline for one query on one document."""
+    return single_flight.run(
+        _flight_key(query, doc_content_hash, mode),
+        lambda: _search(query, doc_content_hash, mode),
+    )
+
+
+async def asearch(query: str, doc_content_hash: str, mode: str = SEARCH_VDB_MODE) -> str:
+    """Async `search`, every remote call is awaited or runs off the event loop."""
+    return await single_flight.arun(
+        _flight_key(query, doc_content_hash, mode),
+        lambda: _asearch(query, doc_content_hash, mode),
+    )
+
+
+def _search(query: str, doc_content_hash: str, mode: str) -> str:
+    _ensure_index()
+    print(f"Tool runtime doc hash: {doc_content_hash}")
+    # Embed once: the vector serves the answer cache and the retriever
+    query_bundle = QueryBundle(query, embedding=_embed_model.get_query_embedding(query))
+    answer_cache = get_answer_cache()
+    with span("answer_cache", tool=TOOL_NAME, cache="miss") as labels:
+        cached = answer_cache.get(doc_content_hash, query_bundle.embedding, mode)
+        if cached is not None:
+            labels["cache"] = "hit"
+            return cached
+
+    # Read before retrieving: an answer built from chunks of a document that
+    # is re-ingested meanwhile must not be cached
+    generation = answer_cache.generation(doc_content_hash)
+    nodes = retrieve(query_bundle, doc_content_hash)
+    if mode == "context" or not nodes:
+        # No chunks (e.g. no partition for the hash): nothing to synthesize from
+        result = pack_context(nodes)
+    else:
+        with span("synthesis", tool=TOOL_NAME, model=AGENT_MODEL):
+            result = str(_response_synthesizer.synthesize(query_bundle, nodes))
+    if nodes:
+        answer_cache.put(
+            doc_content_hash, query, query_bundle.embedding, result, mode, generation
+        )
+    return result
+
+
+async def _aprepare(query: str, doc_content_hash: str, mode: str):
+    """Embedding, answer cache lookup, retrieval and rerank: everything in
+    `asearch` that only depends on the query. Returns (query_bundle, cached
+    answer or None, reranked nodes, answer cache generation)."""
+    _ensure_index()
+    query_bundle = QueryBundle(
+        query, embedding=await _embed_model.aget_query_embedding(query)
+    )
+    answer_cache = get_answer_cache()
+    with span("answer_cache", tool=TOOL_NAME, cache="miss") as labels:
+        cached = await answer_cache.aget(doc_content_hash, query_bundle.embedding, mode)
+        if cached is not None:
+            labels["cache"] = "hit"
+            return query_bundle, cached, [], None
+    # Read before retrieving, see `_search`
+    generation = await answer_cache.ageneration(doc_content_hash)
+    return query_bundle, None, await aretrieve(query_bundle, doc_content_hash), generation
+
+
+def start_prefetch(query: str, doc_content_hash: str, mode: str = SEARCH_VDB_MODE):
+    """Speculatively run the query-only stages of `asearch` for the user input,
+    the system prompt has the model pass it to search_vdb unchanged. Every
+    call must be paired with `release_prefetch`."""
+    if PREFETCH_ENABLED:
+        prefetcher.start(
+            _flight_key(query, doc_content_hash, mode),
+            lambda: _aprepare(query, doc_content_hash, mode),
+        )
+
+
+def release_prefetch(query: str, doc_content_hash: str, mode: str = SEARCH_VDB_MODE):
+    if PREFETCH_ENABLED:
+        prefetcher.release(_flight_key(query, doc_content_hash, mode))
+
+
+async def _asearch(query: str, doc_content_hash: str, mode: str) -> str:
+    print(f"Tool runtime doc hash: {doc_content_hash}")
+    prepared = None
+    prefetched = prefetcher.take(_flight_key(query, doc_content_hash, mode))
+    if prefetched is not None:
+        try:
+            with span("prefetch_wait", tool=TOOL_NAME):
+                prepared = await asyncio.shield(prefetched)
+        except Exception as e:
+            print(f"[ERROR]: prefetch, {e}")
+    if prepared is None:
+        prepared = await _aprepare(query, doc_content_hash, mode)
+    query_bundle, cached, nodes, generation = prepared
+    if cached is not None:
+        return cached
+
+    if mode == "context" or not nodes:
+        result = pack_context(nodes)
+    else:
+        with span("synthesis", tool=TOOL_NAME, model=AGENT_MODEL):
+            result = str(await _response_synthesizer.asynthesize(query_bundle, nodes))
+    if nodes:
+        await get_answer_cache().aput(
+            doc_content_hash, query, query_bundle.embedding, result, mode, generation
+        )
+    return result
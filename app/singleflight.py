@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Collapse identical concurrent calls into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for the same result (or exception) instead of running it
+    again. Nothing is cached once the call completes. A call whose waiters
+    have all been cancelled (clients gone) is cancelled too.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.collapsed = 0
+
+    async def arun(self, key, coro_fn):
+        entry = self._tasks.get(key)
+        if entry is None:
+            self.executions += 1
+            # A task of its own, so a waiter cancelled on client disconnect
+            # does not cancel the call for the others
+            task = asyncio.ensure_future(coro_fn())
+            # [task, waiters]
+            entry = self._tasks[key] = [task, 0]
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self.collapsed += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # Only reached when the last waiter was cancelled. Unregister
+                # first: a caller arriving before the done-callback runs must
+                # start a new call, not join the dying one
+                if self._tasks.get(key) is entry:
+                    del self._tasks[key]
+                task.cancel()
+
+    def _finished(self, key, task):
+        if self._tasks.get(key, [None])[0] is task:
+            del self._tasks[key]
+        # Mark the exception retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def run(self, key, fn):
+        """Thread-safe sync variant, for the sync agent."""
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                self.executions += 1
+                future = self._futures[key] = Future()
+            else:
+                self.collapsed += 1
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+        return future.result()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._tasks) + len(self._futures),
+            "executions": self.executions,
+            "collapsed": self.collapsed,
+        }
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import time
+from contextlib import AsyncExitStack
+from dotenv import load_dotenv
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from app import retrieval
+from app.agent import build_agent, get_model
+from app.checkpointer import open_async_checkpointer
+from app.invalidation import start_document_invalidation
+from app.metrics import observe, span
+from app.retention import RETENTION_ENABLED, CheckpointRetention
+
+load_dotenv()
+
+# Make one call through each client before reporting ready
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+
+
+class Startup:
+    """Connects the serving dependencies in the background so the server
+    answers /healthz while they come up, and reports ready once the agent is
+    built and the clients are warm."""
+
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.seconds = None
+        self._stack = AsyncExitStack()
+        self._task = None
+        # Checkpoint garbage collector, postgres checkpointer only
+        self.retention = None
+        # Document invalidations shared by the API workers, Redis only
+        self.invalidation = None
+
+    def start(self, app):
+        self._task = asyncio.create_task(self._run(app))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.ready = False
+        if self.retention is not None:
+            await self.retention.stop()
+        if self.invalidation is not None:
+            await self.invalidation.stop()
+        # Closes the checkpointer pool if it was opened
+        await self._stack.aclose()
+
+    async def _checkpointer(self):
+        with span("startup", component="checkpointer"):
+            return await self._stack.enter_async_context(open_async_checkpointer())
+
+    async def _model(self):
+        with span("startup", component="agent_model"):
+            return await asyncio.to_thread(get_model)
+
+    async def _run(self, app):
+        started = time.perf_counter()
+        # Subscribed first, so no invalidation is missed while warming up
+        self.invalidation = start_document_invalidation(
+            retrieval.evict_document, retrieval.evict_all_documents
+        )
+        try:
+            # A failed dependency cancels the others
+            async with asyncio.TaskGroup() as group:
+                checkpointer = group.create_task(self._checkpointer())
+                model = group.create_task(self._model())
+                group.create_task(retrieval.ainit())
+            # The async checkpointer needs a running loop, so the async agent is built here
+            app.state.agent = build_agent(checkpointer.result(), model.result())
+            # /ask answers are one-shot: no checkpoints, no Postgres I/O
+            app.state.batch_agent = build_agent(None, model.result())
+            if RETENTION_ENABLED and isinstance(checkpointer.result(), AsyncPostgresSaver):
+                self.retention = CheckpointRetention(checkpointer.result().conn)
+                self.retention.start()
+            if WARMUP_ENABLED:
+                await retrieval.awarm_up()
+        except Exception as e:
+            # ExceptionGroup from the task group, report the first cause
+            cause = e.exceptions[0] if isinstance(e, ExceptionGroup) else e
+            self.error = str(cause)
+            print(f"[ERROR]: startup, {cause}")
+            return
+        self.seconds = time.perf_counter() - started
+        observe("startup", self.seconds, component="total")
+        self.ready = True
+        print(f"Startup ready in {self.seconds:.2f}s")
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "failed": self.error is not None,
+            "seconds": self.seconds,
+        }
@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import os
+from typing import AsyncIterator
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# A frame is flushed once it holds this many characters...
+SSE_FLUSH_CHARS = int(os.getenv("SSE_FLUSH_CHARS", 64))
+# ...or once its oldest token has waited this long
+SSE_FLUSH_INTERVAL = float(os.getenv("SSE_FLUSH_INTERVAL_MS", 50)) / 1000
+# Keep-alive comment sent when nothing was written for this long (e.g. tool calls)
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_S", 15))
+# How often the client connection is checked while waiting for tokens
+SSE_DISCONNECT_POLL = float(os.getenv("SSE_DISCONNECT_POLL_S", 1))
+
+HEARTBEAT_FRAME = ": keep-alive\n\n"
+
+_DONE = object()
+
+
+def sse_frame(text: str) -> str:
+    return f"data: {text}\n\n"
+
+
+async def sse_stream(
+    chunks: AsyncIterator[str],
+    request,
+    flush_chars: int = SSE_FLUSH_CHARS,
+    flush_interval: float = SSE_FLUSH_INTERVAL,
+    heartbeat_interval: float = SSE_HEARTBEAT_INTERVAL,
+    disconnect_poll: float = SSE_DISCONNECT_POLL,
+) -> AsyncIterator[str]:
+    """Turn a stream of text chunks into SSE frames.
+
+    Chunks are consumed on a separate task so that the frame writer can
+    coalesce tokens, emit heartbeats while the agent is busy in a tool call,
+    and cancel the agent run (including an in-flight search_vdb) as soon as
+    the client goes away.
+    """
+    queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # Cancelled by the writer, nobody is reading anymore
+                raise
+            # Raised by the chunks themselves (e.g. a cancelled shared search)
+            queue.put_nowait(RuntimeError("agent run was cancelled"))
+        except Exception as e:
+            queue.put_nowait(e)
+        finally:
+            # The queue is unbounded, so this cannot block: the writer always
+            # learns that the producer stopped
+            queue.put_nowait(_DONE)
+
+    loop = asyncio.get_running_loop()
+    producer = asyncio.create_task(produce())
+    buffer = []
+    buffered_chars = 0
+    first_buffered_at = 0.0
+    last_sent = last_poll = loop.time()
+
+    try:
+        while True:
+            deadline = min(last_sent + heartbeat_interval, last_poll + disconnect_poll)
+            if buffer:
+                deadline = min(deadline, first_buffered_at + flush_interval)
+            try:
+                item = await asyncio.wait_for(
+                    queue.get(), timeout=max(0.0, deadline - loop.time())
+                )
+            except TimeoutError:
+                item = None
+
+            now = loop.time()
+            if isinstance(item, str):
+                if not buffer:
+                    first_buffered_at = now
+                buffer.append(item)
+                buffered_chars += len(item)
+
+            finished = item is _DONE or isinstance(item, Exception)
+            if buffer and (
+                finished
+                or buffered_chars >= flush_chars
+                or now >= first_buffered_at + flush_interval
+            ):
+                yield sse_frame("".join(buffer))
+                buffer.clear()
+                buffered_chars = 0
+                last_sent = now
+
+            if isinstance(item, Exception):
+                yield sse_frame(f"[ERROR]: {item}")
+            if finished:
+                return
+
+            if now >= last_poll + disconnect_poll:
+                last_poll = now
+                if await request.is_disconnected():
+                    print("client disconnected, cancelling agent run")
+                    return
+            if now >= last_sent + heartbeat_interval:
+                yield HEARTBEAT_FRAME
+                last_sent = now
+    finally:
+        producer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await producer
@@ -0,0 +1,78 @@
+"""Compare query-embedding latency and throughput of the remote and local backends.
+
+Both run without the query cache, so every request reaches the model.
+
+Usage:
+    python -m bench.bench_embedding --backends google bge --requests 200 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from app.embeddings import build_base_embed_model, embedding_stats
+from bench.fakes import _WORDS
+from bench.stats import percentile
+
+
+async def _run_backend(backend: str, args) -> dict:
+    embed_model = build_base_embed_model(backend)
+    rng = random.Random(args.seed)
+    queries = [" ".join(rng.choices(_WORDS, k=args.words)) for _ in range(args.requests)]
+    # Warm-up, excluded from timings (model load, connection setup)
+    await embed_model.aget_query_embedding(queries[0])
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(query):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await embed_model.aget_query_embedding(query)
+            except Exception:
+                # e.g. remote rate limiting, counted rather than aborting the run
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(q) for q in queries])
+    elapsed = time.perf_counter() - started
+    return {
+        "backend": backend,
+        "throughput_rps": len(latencies) / elapsed,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["google", "bge"])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--words", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'rps':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for backend in args.backends:
+        try:
+            r = await _run_backend(backend, args)
+        except Exception as e:
+            print(f"{backend:<10} [ERROR]: {e}")
+            continue
+        print(
+            f"{r['backend']:<10} {r['throughput_rps']:>8.1f} {r['errors']:>7} "
+            f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+        )
+    print(f"worker stats: {embedding_stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
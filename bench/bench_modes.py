@@ -0,0 +1,92 @@
+"""Compare end-to-end latency and token cost of the two search_vdb modes.
+
+Runs every question through the agent once per mode against the live
+services (Gemini, Chroma, reranker) with an in-memory checkpointer and the
+answer cache disabled, so both modes do the full pipeline every time.
+
+Usage:
+    python -m bench.bench_modes questions.jsonl --modes answer context
+where each line of questions.jsonl is {"input": ..., "doc_content_hash": ...}.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from langgraph.checkpoint.memory import InMemorySaver
+from app import cache, retrieval
+from app.agent import Context, build_agent
+
+
+def _usage(messages) -> tuple[int, int]:
+    input_tokens = output_tokens = 0
+    for message in messages:
+        usage = getattr(message, "usage_metadata", None) or {}
+        input_tokens += usage.get("input_tokens", 0)
+        output_tokens += usage.get("output_tokens", 0)
+    return input_tokens, output_tokens
+
+
+async def _run_mode(agent, mode: str, questions: list[dict]) -> dict:
+    rows = []
+    for question in questions:
+        retrieval.token_counter.reset_counts()
+        started = time.perf_counter()
+        result = await agent.ainvoke(
+            {"messages": [{"role": "user", "content": question["input"]}]},
+            {"configurable": {"thread_id": str(uuid.uuid4())}},
+            context=Context(
+                doc_content_hash=question["doc_content_hash"], search_mode=mode
+            ),
+        )
+        latency = time.perf_counter() - started
+        agent_in, agent_out = _usage(result["messages"])
+        rows.append(
+            {
+                "latency_s": latency,
+                "agent_tokens": agent_in + agent_out,
+                "synthesis_tokens": retrieval.token_counter.total_llm_token_count,
+            }
+        )
+    latencies = [r["latency_s"] for r in rows]
+    return {
+        "mode": mode,
+        "questions": len(rows),
+        "p50_s": statistics.median(latencies),
+        "mean_s": statistics.fmean(latencies),
+        "max_s": max(latencies),
+        "agent_tokens": sum(r["agent_tokens"] for r in rows),
+        "synthesis_tokens": sum(r["synthesis_tokens"] for r in rows),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", help="JSONL file of {input, doc_content_hash}")
+    parser.add_argument("--modes", nargs="+", default=["answer", "context"])
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+
+    # Cached answers would hide the cost difference between the modes
+    cache._answer_cache = cache.AnswerCache(redis_url=None)
+    agent = build_agent(InMemorySaver())
+
+    print(
+        f"{'mode':<8} {'n':>4} {'p50 s':>7} {'mean s':>7} {'max s':>7} "
+        f"{'agent tok':>10} {'synth tok':>10} {'total tok':>10}"
+    )
+    for mode in args.modes:
+        r = await _run_mode(agent, mode, questions)
+        print(
+            f"{r['mode']:<8} {r['questions']:>4} {r['p50_s']:>7.2f} {r['mean_s']:>7.2f} "
+            f"{r['max_s']:>7.2f} {r['agent_tokens']:>10} {r['synthesis_tokens']:>10} "
+            f"{r['agent_tokens'] + r['synthesis_tokens']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""Compare rerank latency and throughput of the configured backends.
+
+Usage:
+    python -m bench.bench_rerank --backends cohere bge --requests 200 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from app.rerank import get_reranker, rerank_stats
+from bench.fakes import _WORDS
+from bench.stats import percentile
+
+
+def _candidates(rng: random.Random, count: int, words: int) -> list[NodeWithScore]:
+    return [
+        NodeWithScore(
+            node=TextNode(text=" ".join(rng.choices(_WORDS, k=words))), score=0.0
+        )
+        for _ in range(count)
+    ]
+
+
+async def _run_backend(backend: str, args) -> dict:
+    reranker = get_reranker(top_n=args.top_n, backend=backend)
+    rng = random.Random(args.seed)
+    workload = [
+        (
+            QueryBundle(" ".join(rng.choices(_WORDS, k=8))),
+            _candidates(rng, args.candidates, args.words),
+        )
+        for _ in range(args.requests)
+    ]
+    # Warm-up, excluded from timings (model load, connection setup)
+    await reranker.apostprocess_nodes(workload[0][1], workload[0][0])
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(query_bundle, nodes):
+        async with semaphore:
+            started = time.perf_counter()
+            await reranker.apostprocess_nodes(nodes, query_bundle)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(q, nodes) for q, nodes in workload])
+    elapsed = time.perf_counter() - started
+    return {
+        "backend": backend,
+        "requests": args.requests,
+        "throughput_rps": args.requests / elapsed,
+        "pairs_per_s": args.requests * args.candidates / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["cohere", "bge"])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--candidates", type=int, default=10)
+    parser.add_argument("--top-n", type=int, default=4)
+    parser.add_argument("--words", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'rps':>8} {'pairs/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for backend in args.backends:
+        try:
+            r = await _run_backend(backend, args)
+        except Exception as e:
+            print(f"{backend:<10} [ERROR]: {e}")
+            continue
+        print(
+            f"{r['backend']:<10} {r['throughput_rps']:>8.1f} {r['pairs_per_s']:>10.1f} "
+            f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+        )
+    print(f"worker stats: {rerank_stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
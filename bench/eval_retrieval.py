@@ -0,0 +1,176 @@
+"""Recall and latency of the search_vdb retrieval pipeline over a golden set.
+
+Every configuration in the sweep (similarity_top_k x rerank top_n x cache
+setting) runs all golden queries concurrently through `retrieval.aretrieve`,
+the same vector search and rerank stages `search_vdb` uses, and reports
+recall@k (k = top_n), MRR and p50/p95 latency of embedding + retrieval +
+rerank. Synthesis is left out, it does not change which chunks are found.
+
+Cache settings:
+    off   remote embedding for every query, Chroma for every search
+    warm  query embedding cache and hot document index, every golden document
+          loaded and one untimed pass run first, so the timed pass sees
+          steady-state hit rates
+
+Usage:
+    python -m bench.eval_retrieval golden.jsonl --top-k 5 10 20 --top-n 3 4 6
+        --cache off warm --target-recall 0.9
+where each line of golden.jsonl is
+    {"query": ..., "doc_content_hash": ..., "expected_ids": [chunk ids]}
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import time
+from llama_index.core import QueryBundle
+from app import retrieval
+from app.embeddings import build_base_embed_model
+from app.rerank import RERANK_BACKEND, get_reranker
+from bench.stats import percentile
+
+CACHE_SETTINGS = ("off", "warm")
+
+
+def load_golden(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def recall_at_k(retrieved: list[str], expected: list[str], k: int) -> float:
+    if not expected:
+        return 0.0
+    return len(set(retrieved[:k]) & set(expected)) / len(set(expected))
+
+
+def reciprocal_rank(retrieved: list[str], expected: list[str]) -> float:
+    expected = set(expected)
+    for rank, node_id in enumerate(retrieved, start=1):
+        if node_id in expected:
+            return 1.0 / rank
+    return 0.0
+
+
+async def _run_query(item, embed_model, top_k, reranker, use_hot_index, semaphore):
+    async with semaphore:
+        started = time.perf_counter()
+        query = item["query"]
+        query_bundle = QueryBundle(
+            query, embedding=await embed_model.aget_query_embedding(query)
+        )
+        nodes = await retrieval.aretrieve(
+            query_bundle,
+            item["doc_content_hash"],
+            similarity_top_k=top_k,
+            reranker=reranker,
+            use_hot_index=use_hot_index,
+        )
+        latency = time.perf_counter() - started
+    return [n.node.node_id for n in nodes], latency
+
+
+async def evaluate(
+    golden: list[dict],
+    top_k: int,
+    top_n: int,
+    cache: str,
+    embed_models: dict,
+    concurrency: int = 8,
+    reranker=None,
+) -> dict:
+    """Run every golden query through one configuration. `embed_models` maps
+    a cache setting to the embedding model used for it."""
+    reranker = reranker or get_reranker(top_n)
+    embed_model = embed_models[cache]
+    use_hot_index = cache == "warm"
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_all():
+        return await asyncio.gather(
+            *[
+                _run_query(item, embed_model, top_k, reranker, use_hot_index, semaphore)
+                for item in golden
+            ]
+        )
+
+    if cache == "warm":
+        # Load every golden document into the hot index now: a lookup alone
+        # only schedules a background load, the timed pass would mix paths
+        if retrieval.hot_index is not None:
+            for doc_content_hash in {item["doc_content_hash"] for item in golden}:
+                await asyncio.to_thread(retrieval.hot_index.ensure, doc_content_hash)
+        await run_all()
+    results = await run_all()
+
+    recalls, rrs, latencies = [], [], []
+    for item, (retrieved, latency) in zip(golden, results):
+        recalls.append(recall_at_k(retrieved, item["expected_ids"], top_n))
+        rrs.append(reciprocal_rank(retrieved, item["expected_ids"]))
+        latencies.append(latency * 1000)
+    return {
+        "top_k": top_k,
+        "top_n": top_n,
+        "cache": cache,
+        "queries": len(golden),
+        "recall": round(statistics.fmean(recalls), 4),
+        "mrr": round(statistics.fmean(rrs), 4),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+    }
+
+
+def cheapest(rows: list[dict], target_recall: float) -> dict | None:
+    """Lowest p95 among configurations meeting the recall target; fewer
+    candidates to rerank breaks ties."""
+    passing = [r for r in rows if r["recall"] >= target_recall]
+    return min(passing, key=lambda r: (r["p95_ms"], r["top_k"], r["top_n"]), default=None)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("golden", help="JSONL file of golden queries")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[retrieval.SIMILARITY_TOP_K])
+    parser.add_argument("--top-n", type=int, nargs="+", default=[retrieval.RERANK_TOP_N])
+    parser.add_argument("--cache", nargs="+", choices=CACHE_SETTINGS, default=list(CACHE_SETTINGS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--target-recall", type=float, default=None)
+    parser.add_argument("--output", help="append result rows to this JSONL file")
+    args = parser.parse_args()
+
+    golden = load_golden(args.golden)
+    await retrieval.ainit()
+    # "warm" shares the cached model retrieval itself uses
+    embed_models = {"off": build_base_embed_model(), "warm": retrieval._embed_model}
+
+    rows = []
+    print(f"rerank backend: {RERANK_BACKEND}, {len(golden)} queries")
+    print(f"{'top_k':>6} {'top_n':>6} {'cache':>6} {'recall':>8} {'mrr':>8} {'p50_ms':>9} {'p95_ms':>9}")
+    for top_k, top_n, cache in itertools.product(args.top_k, args.top_n, args.cache):
+        if top_n > top_k:
+            continue
+        row = await evaluate(golden, top_k, top_n, cache, embed_models, args.concurrency)
+        rows.append(row)
+        print(
+            f"{top_k:>6} {top_n:>6} {cache:>6} {row['recall']:>8.3f} {row['mrr']:>8.3f} "
+            f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}"
+        )
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({**row, "rerank_backend": RERANK_BACKEND}) + "\n")
+    if args.target_recall is not None:
+        best = cheapest(rows, args.target_recall)
+        if best is None:
+            print(f"\nNo configuration reaches recall {args.target_recall}")
+        else:
+            print(
+                f"\nCheapest at recall >= {args.target_recall}: top_k={best['top_k']} "
+                f"top_n={best['top_n']} cache={best['cache']} (p95 {best['p95_ms']} ms)"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
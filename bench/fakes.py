@@ -0,0 +1,178 @@
+"""Deterministic local stand-ins for the external services used by the agent."""
+
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Any
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, ToolMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.schema import TextNode
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from app.rerank import RerankWorker, WorkerRerank
+
+_WORDS = (
+    "chronos processor wafer node cache memory bandwidth thermal package clock "
+    "voltage firmware yield lithography transistor benchmark interconnect core "
+    "latency throughput power efficiency design fabrication silicon"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """Agent model that always calls search_vdb with the user query, then
+    streams a fixed-length answer once the tool result is in."""
+
+    latency: float = 0.2
+    token_latency: float = 0.01
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _chunks(self, messages) -> list[AIMessageChunk]:
+        last = messages[-1]
+        if not isinstance(last, ToolMessage):
+            args = json.dumps({"query": str(last.content)})
+            return [
+                AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {
+                            "name": "search_vdb",
+                            "args": args,
+                            "id": f"call_{uuid.uuid4().hex[:12]}",
+                            "index": 0,
+                        }
+                    ],
+                )
+            ]
+        words = str(last.content).split() or _WORDS
+        return [
+            AIMessageChunk(content=f"{words[i % len(words)]} ")
+            for i in range(self.answer_tokens)
+        ]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        chunks = self._chunks(messages)
+        message = chunks[0]
+        for chunk in chunks[1:]:
+            message += chunk
+        return ChatResult(
+            generations=[ChatGeneration(message=message_chunk_to_message(message))]
+        )
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Hash-seeded unit vectors: the same text always maps to the same vector."""
+
+    dim: int = 256
+    latency: float = 0.0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    def _vector(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).normal(size=self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        time.sleep(self.latency)
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        await asyncio.sleep(self.latency)
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._vector(text)
+
+
+class FakeEncoder:
+    """FlagEmbedding-like encoder over FakeEmbedding vectors."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._embedding = FakeEmbedding()
+
+    def encode_queries(self, texts):
+        time.sleep(self.latency)
+        return np.array([self._embedding._vector(t) for t in texts])
+
+    def encode_corpus(self, texts):
+        return self.encode_queries(texts)
+
+
+def load_fake_encoder(model_name: str) -> FakeEncoder:
+    """Picklable loader for app.embeddings.EmbeddingProcess."""
+    return FakeEncoder(latency=0.05)
+
+
+class FakeLLM(CustomLLM):
+    """Synthesizer LLM answering with the first words of its prompt context."""
+
+    latency: float = 0.3
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="fake-llm")
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.latency)
+        return CompletionResponse(text=" ".join(prompt.split()[-40:]))
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        await asyncio.sleep(self.latency)
+        return CompletionResponse(text=" ".join(prompt.split()[-40:]))
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        yield self.complete(prompt, formatted, **kwargs)
+
+
+def stub_reranker(top_n: int = 4, latency: float = 0.0) -> WorkerRerank:
+    """Word-overlap scorer behind the same batching worker as the BGE backend."""
+
+    def score(pairs):
+        time.sleep(latency)
+        return [
+            len(set(query.lower().split()) & set(passage.lower().split())) / 10
+            for query, passage in pairs
+        ]
+
+    return WorkerRerank(RerankWorker(score, workers=1), top_n=top_n)
+
+
+def build_corpus(collection, embed_model, docs: int, chunks_per_doc: int, seed: int = 0):
+    """Fill a Chroma collection with synthetic documents; returns their hashes."""
+    rng = np.random.default_rng(seed)
+    hashes = [f"doc-{i:04d}" for i in range(docs)]
+    nodes = []
+    for doc_hash in hashes:
+        for _ in range(chunks_per_doc):
+            text = " ".join(rng.choice(_WORDS, size=80))
+            node = TextNode(text=text, metadata={"doc_content_hash": doc_hash})
+            node.embedding = embed_model.get_text_embedding(text)
+            nodes.append(node)
+    ChromaVectorStore(chroma_collection=collection).add(nodes)
+    return hashes
+
+
+def sample_questions(rng, count: int) -> list[str]:
+    return [" ".join(rng.choice(_WORDS, size=8)) + "?" for _ in range(count)]
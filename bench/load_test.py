@@ -0,0 +1,224 @@
+"""Offline load test of /chat with local stand-ins for every external service.
+
+Gemini, the embedding API and the synthesizer are replaced by deterministic
+fakes with configurable latency, Chroma by an in-process EphemeralClient, the
+reranker by a word-overlap stub and Postgres by the in-memory checkpointer.
+The real app is served by uvicorn on a local port and driven by concurrent
+SSE clients, so the measured path is the same one production traffic takes.
+
+Usage:
+    python -m bench.load_test --clients 32 --requests 256
+Each run is appended to bench/results.jsonl and compared with the previous
+run that used the same parameters.
+"""
+
+import os
+
+# Must be set before the app modules read their configuration
+os.environ.update(
+    AGENT_CHECKPOINTER="memory",
+    AGENT_MODEL="fake-chat",
+    CACHE_REDIS_URL="",
+    RAG_REDIS_URL="",
+    ANONYMIZED_TELEMETRY="False",
+)
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+import chromadb
+import httpx
+import numpy as np
+import uvicorn
+from app import agent as agent_module
+from app import retrieval
+from app.api import app
+from bench.fakes import (
+    FakeChatModel,
+    FakeEmbedding,
+    FakeLLM,
+    build_corpus,
+    sample_questions,
+    stub_reranker,
+)
+from bench.stats import percentile
+
+RESULTS_FILE = Path(__file__).parent / "results.jsonl"
+
+
+def _setup(args):
+    embed_model = FakeEmbedding(latency=args.embed_latency)
+    collection = chromadb.EphemeralClient().get_or_create_collection(
+        f"bench-{uuid.uuid4().hex[:8]}"
+    )
+    hashes = build_corpus(collection, embed_model, args.docs, args.chunks, args.seed)
+    retrieval.init(
+        collection=collection,
+        embed_model=embed_model,
+        llm=FakeLLM(latency=args.llm_latency),
+        reranker=stub_reranker(latency=args.rerank_latency),
+    )
+    agent_module._model = FakeChatModel(
+        latency=args.model_latency,
+        token_latency=args.token_latency,
+        answer_tokens=args.answer_tokens,
+    )
+    return hashes
+
+
+async def _one_request(client, payload) -> dict:
+    started = time.perf_counter()
+    ttft = None
+    frames = 0
+    async with client.stream("POST", "/chat", json=payload) as response:
+        status = response.status_code
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                frames += 1
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+    return {
+        "status": status,
+        "ttft": ttft,
+        "total": time.perf_counter() - started,
+        "frames": frames,
+    }
+
+
+async def _drive(base_url: str, args, hashes: list[str]) -> dict:
+    rng = random.Random(args.seed)
+    questions = sample_questions(np.random.default_rng(args.seed), args.distinct_questions)
+    payloads = [
+        {
+            "input": rng.choice(questions),
+            "doc_content_hash": rng.choice(hashes),
+            "thread_id": str(uuid.uuid4()),
+        }
+        for _ in range(args.requests)
+    ]
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    results = []
+
+    async def client_loop(client):
+        while not queue.empty():
+            payload = queue.get_nowait()
+            results.append(await _one_request(client, payload))
+
+    limits = httpx.Limits(max_connections=args.clients)
+    timeout = httpx.Timeout(60.0)
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        await asyncio.gather(*[client_loop(client) for _ in range(args.clients)])
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ok = [r for r in results if r["status"] == 200 and r["ttft"] is not None]
+    ttfts = [r["ttft"] * 1000 for r in ok]
+    totals = [r["total"] * 1000 for r in ok]
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "rejected": sum(r["status"] == 429 for r in results),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(ok) / elapsed, 2),
+        "ttft_ms_p50": round(percentile(ttfts, 50), 1),
+        "ttft_ms_p95": round(percentile(ttfts, 95), 1),
+        "ttft_ms_p99": round(percentile(ttfts, 99), 1),
+        "total_ms_p50": round(percentile(totals, 50), 1),
+        "total_ms_p95": round(percentile(totals, 95), 1),
+        "total_ms_p99": round(percentile(totals, 99), 1),
+        # Peak allocation above baseline shared by the in-flight requests
+        "peak_kib_per_client": round((peak - baseline) / 1024 / args.clients, 1),
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _save_and_compare(params: dict, result: dict):
+    previous = None
+    if RESULTS_FILE.exists():
+        for line in RESULTS_FILE.read_text(encoding="utf-8").splitlines():
+            record = json.loads(line)
+            if record["params"] == params:
+                previous = record
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "params": params,
+        "result": result,
+    }
+    with RESULTS_FILE.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+    print(f"\n{'metric':<22} {'this run':>12} {'previous':>12}")
+    for key, value in result.items():
+        before = previous["result"].get(key, "") if previous else ""
+        print(f"{key:<22} {value:>12} {before:>12}")
+    if previous:
+        print(f"(previous: {previous['timestamp']} @ {previous['revision']})")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=200, help="chunks per document")
+    parser.add_argument("--distinct-questions", type=int, default=50)
+    parser.add_argument("--model-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--embed-latency", type=float, default=0.1)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--rerank-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    hashes = _setup(args)
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+    server = uvicorn.Server(config)
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            while (await client.get("/readyz")).status_code != 200:
+                await asyncio.sleep(0.05)
+        result = await _drive(base_url, args, hashes)
+    finally:
+        server.should_exit = True
+        await serve
+
+    params = {k: v for k, v in vars(args).items() if k != "no_save"}
+    if args.no_save:
+        print(json.dumps(result, indent=2))
+    else:
+        _save_and_compare(params, result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,12 @@
+"""Summary statistics shared by the benchmarks."""
+
+import statistics
+
+
+def percentile(values: list[float], q: int) -> float:
+    """q-th percentile of `values`, 0.0 when empty."""
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100)[q - 1]
@@ -1,6 +1,10 @@
 import os
 import sys
 import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
 from chromadb.config import Settings
 import redis
@@ -15,6 +19,12 @@ CHROMA_PORT = int(os.getenv("CHROMA_PORT", 8000))
 RAG_REDIS_URL = os.getenv("RAG_REDIS_URL")
 LLAMA_REDIS_CACHE_NAME = os.getenv("LLAMA_REDIS_CACHE_NAME")
 LLAMA_DOC_STORE_NAME = os.getenv("LLAMA_DOC_STORE_NAME")
+# 每批删除的文档 / Redis 键数量 (Chroma 建议每次最多删除 5000 个)
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", 5000))
+# 并行清理的集合数量
+PURGE_WORKERS = int(os.getenv("PURGE_WORKERS", 4))
+# 分区数量, 必须与 API 的 CHROMA_PARTITION_BUCKETS 一致
+CHROMA_PARTITION_BUCKETS = int(os.getenv("CHROMA_PARTITION_BUCKETS", 64))
 # ===========================================
 
 
@@ -28,8 +38,184 @@ class Colors:
     BOLD = "\033[1m"
 
 
+class Progress:
+    """批量操作进度: 每批打印一行已处理数量和吞吐量, 多线程安全"""
+
+    def __init__(self, label, total=None, verb="已删除"):
+        self.label = label
+        self.verb = verb
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def advance(self, n):
+        with self._lock:
+            self.done += n
+            total = f"/{self.total}" if self.total is not None else ""
+            print(f"  - {self.label}: {self.verb} {self.done}{total} ({self.rate():.0f}/s)", flush=True)
+
+    def rate(self):
+        return self.done / max(time.perf_counter() - self.started, 1e-9)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {"deleted": self.done, "seconds": round(elapsed, 2), "rate": round(self.rate())}
+
+
+def purge_collection(col, batch_size=PURGE_BATCH_SIZE):
+    """分页清空集合: 每次只取一页 ID 并立即删除, 内存占用与集合大小无关"""
+    progress = Progress(col.name, col.count())
+    while True:
+        # 上一页已删除, 所以始终从 offset 0 读取下一页
+        page = col.get(limit=batch_size, offset=0, include=[])
+        if not page["ids"]:
+            break
+        col.delete(ids=page["ids"])
+        progress.advance(len(page["ids"]))
+    return progress.summary()
+
+
+def purge_collections(client, names, batch_size=PURGE_BATCH_SIZE, workers=PURGE_WORKERS):
+    """并行清空多个集合, 返回 {集合名: 结果}"""
+
+    def purge(name):
+        try:
+            return purge_collection(client.get_collection(name), batch_size)
+        except Exception as e:
+            print(f"    {Colors.FAIL}{name} 失败: {e}{Colors.ENDC}")
+            return {"error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        return dict(zip(names, pool.map(purge, names)))
+
+
+def purge_redis(r, patterns, batch_size=PURGE_BATCH_SIZE):
+    """SCAN 匹配的键并按批用流水线 UNLINK 删除, 返回 {pattern: 结果}
+
+    UNLINK 在后台线程释放内存, 不会像 DEL 那样阻塞 Redis;
+    每批只有一次往返, 且不会把所有键载入内存
+    """
+    results = {}
+    for pattern in patterns:
+        progress = Progress(f"redis {pattern}")
+        batch = []
+        for key in r.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                progress.advance(_unlink(r, batch))
+                batch = []
+        if batch:
+            progress.advance(_unlink(r, batch))
+        results[pattern] = progress.summary()
+    return results
+
+
+def _unlink(r, keys):
+    pipe = r.pipeline(transaction=False)
+    # 分成小命令, 避免单条命令参数过多
+    for i in range(0, len(keys), 500):
+        pipe.unlink(*keys[i:i + 500])
+    return sum(pipe.execute())
+
+
+def reindex_collection(source, target, embed_model, batch_size=PURGE_BATCH_SIZE):
+    """用 embed_model 重新计算 source 中所有文档的向量并写入 target
+
+    按页读取 (limit/offset), 每页嵌入后立即 upsert, 不会一次载入整个集合;
+    target 的 metadata 记录了嵌入模型标签, 检索时会校验
+    """
+    progress = Progress(f"{source.name} -> {target.name}", source.count(), verb="已写入")
+    offset = 0
+    while True:
+        page = source.get(
+            limit=batch_size, offset=offset, include=["documents", "metadatas"]
+        )
+        if not page["ids"]:
+            break
+        embeddings = embed_model.get_text_embedding_batch(page["documents"])
+        target.upsert(
+            ids=page["ids"],
+            embeddings=embeddings,
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+        )
+        progress.advance(len(page["ids"]))
+        offset += len(page["ids"])
+    summary = progress.summary()
+    return {"written": summary["deleted"], "seconds": summary["seconds"], "rate": summary["rate"]}
+
+
+def open_reindex_target(client, source, name, backend):
+    """创建 (或复用) 带嵌入模型标签的目标集合, 标签不一致时拒绝写入"""
+    from app.embeddings import EMBEDDING_TAG_KEY, check_collection_tag, embedding_tag
+
+    # 保留源集合的距离度量等设置
+    metadata = {k: v for k, v in (source.metadata or {}).items() if k != EMBEDDING_TAG_KEY}
+    metadata[EMBEDDING_TAG_KEY] = embedding_tag(backend)
+    target = client.get_or_create_collection(name, metadata=metadata)
+    check_collection_tag(target, backend)
+    return target
+
+
+def partition_collection(client, source, base, mode, buckets, batch_size=PURGE_BATCH_SIZE):
+    """按 doc_content_hash 把 source 的数据分流到分区集合 (不重新嵌入)
+
+    按页读取 (limit/offset), 每页按目标分区分组后立即 upsert, 内存只与批大小有关;
+    分区沿用源集合的 metadata (嵌入模型标签、距离度量), 源集合保持不变
+    """
+    from app.partitions import PartitionRouter
+
+    router = PartitionRouter(
+        client, base, mode=mode, buckets=buckets, metadata=dict(source.metadata or {})
+    )
+    progress = Progress(f"{source.name} -> {base} ({mode})", source.count(), verb="已迁移")
+    partitions, skipped = set(), 0
+    offset = 0
+    while True:
+        page = source.get(
+            limit=batch_size,
+            offset=offset,
+            include=["embeddings", "documents", "metadatas"],
+        )
+        if not page["ids"]:
+            break
+        groups = {}
+        for i, metadata in enumerate(page["metadatas"]):
+            doc_hash = (metadata or {}).get("doc_content_hash")
+            if doc_hash is None:
+                # 没有文档哈希的数据无法路由, 检索时也不会被查到
+                skipped += 1
+                continue
+            groups.setdefault(doc_hash, []).append(i)
+        for doc_hash, rows in groups.items():
+            target = router.get_or_create(doc_hash)
+            target.upsert(
+                ids=[page["ids"][i] for i in rows],
+                embeddings=[page["embeddings"][i] for i in rows],
+                documents=[page["documents"][i] for i in rows],
+                metadatas=[page["metadatas"][i] for i in rows],
+            )
+            partitions.add(target.name)
+        progress.advance(len(page["ids"]))
+        offset += len(page["ids"])
+    summary = progress.summary()
+    return {
+        "written": summary["deleted"] - skipped,
+        "skipped": skipped,
+        "partitions": len(partitions),
+        "seconds": summary["seconds"],
+        "rate": summary["rate"],
+    }
+
+
+def _redis_patterns():
+    return [f"{name}*" for name in (LLAMA_REDIS_CACHE_NAME, LLAMA_DOC_STORE_NAME) if name]
+
+
 class ChromaAdmin:
-    def __init__(self):
+    def __init__(self, assume_yes=False):
+        self.assume_yes = assume_yes
         print(
             f"{Colors.HEADER}正在连接 ChromaDB ({CHROMA_HOST}:{CHROMA_PORT})...{Colors.ENDC}"
         )
@@ -199,40 +385,16 @@ class ChromaAdmin:
         print(f"DocStore Name: {LLAMA_DOC_STORE_NAME}")
 
         try:
-            r = redis.from_url(RAG_REDIS_URL, decode_responses=True)
-
-            # 统计当前键数量
-            cache_keys = list(r.scan_iter(f"{LLAMA_REDIS_CACHE_NAME}*"))
-            docstore_keys = list(r.scan_iter(f"{LLAMA_DOC_STORE_NAME}*"))
-
-            print(f"\n当前状态:")
-            print(f"  - Cache 键数量: {len(cache_keys)}")
-            print(f"  - DocStore 键数量: {len(docstore_keys)}")
-
-            if len(cache_keys) == 0 and len(docstore_keys) == 0:
-                print(f"{Colors.WARNING}缓存为空，无需清理{Colors.ENDC}")
-                return
-
-            confirm = input(f"\n{Colors.WARNING}确认清除所有缓存? (y/n): {Colors.ENDC}")
-            if confirm.lower() != "y":
+            r = redis.from_url(RAG_REDIS_URL)
+            if not self._confirm(f"\n{Colors.WARNING}确认清除所有缓存? (y/n): {Colors.ENDC}", "y"):
                 print("操作已取消")
                 return
 
-            # 删除所有缓存键
-            deleted_cache = 0
-            for key in cache_keys:
-                r.delete(key)
-                deleted_cache += 1
-
-            # 删除所有 docstore 键
-            deleted_docstore = 0
-            for key in docstore_keys:
-                r.delete(key)
-                deleted_docstore += 1
-
+            results = purge_redis(r, _redis_patterns())
             print(f"{Colors.GREEN}✓ 清除完成!{Colors.ENDC}")
-            print(f"  - 已删除 Cache 键: {deleted_cache}")
-            print(f"  - 已删除 DocStore 键: {deleted_docstore}")
+            for pattern, result in results.items():
+                print(f"  - {pattern}: 已删除 {result['deleted']} 个键, 耗时 {result['seconds']}s")
+            return results
 
         except Exception as e:
             print(f"{Colors.FAIL}清除失败: {e}{Colors.ENDC}")
@@ -262,17 +424,11 @@ class ChromaAdmin:
             return
 
         try:
-            # 获取所有 ID
-            results = col.get(include=["ids"])
-            all_ids = results["ids"]
-
-            # 批量删除（Chroma 建议每次最多删除 5000 个）
-            batch_size = 5000
-            for i in range(0, len(all_ids), batch_size):
-                batch = all_ids[i:i + batch_size]
-                col.delete(ids=batch)
-
-            print(f"{Colors.GREEN}✓ 已删除 {len(all_ids)} 个文档{Colors.ENDC}")
+            result = purge_collection(col)
+            print(
+                f"{Colors.GREEN}✓ 已删除 {result['deleted']} 个文档, "
+                f"耗时 {result['seconds']}s ({result['rate']}/s){Colors.ENDC}"
+            )
 
         except Exception as e:
             print(f"{Colors.FAIL}删除失败: {e}{Colors.ENDC}")
@@ -285,8 +441,7 @@ class ChromaAdmin:
         print("  2. Redis DocStore")
         print("  3. 所有 ChromaDB 集合中的数据")
 
-        confirm = input("\n请输入 'CLEAR' 确认操作: ")
-        if confirm != "CLEAR":
+        if not self._confirm("\n请输入 'CLEAR' 确认操作: ", "CLEAR"):
             print("操作已取消")
             return
 
@@ -294,29 +449,104 @@ class ChromaAdmin:
         self.clear_redis_cache()
 
         print(f"\n{Colors.BOLD}步骤 2/3: 清除 ChromaDB 数据{Colors.ENDC}")
-        cols = self.client.list_collections()
-        total_deleted = 0
-        for col in cols:
-            real_col = self.client.get_collection(col.name)
-            count = real_col.count()
-            if count > 0:
-                print(f"  - 清除 {col.name} ({count} 个文档)...")
-                try:
-                    results = real_col.get(include=["ids"])
-                    all_ids = results["ids"]
-                    batch_size = 5000
-                    for i in range(0, len(all_ids), batch_size):
-                        batch = all_ids[i:i + batch_size]
-                        real_col.delete(ids=batch)
-                    total_deleted += len(all_ids)
-                except Exception as e:
-                    print(f"    {Colors.FAIL}失败: {e}{Colors.ENDC}")
+        self.purge_all_collections()
 
         print(f"\n{Colors.BOLD}步骤 3/3: 完成{Colors.ENDC}")
+
+    def purge_all_collections(self, workers=PURGE_WORKERS):
+        names = [c.name for c in self.client.list_collections()]
+        results = purge_collections(self.client, names, workers=workers)
+        total_deleted = sum(r.get("deleted", 0) for r in results.values())
         print(f"{Colors.GREEN}✓ 总计删除 {total_deleted} 个文档{Colors.ENDC}")
+        return results
+
+    def _confirm(self, prompt, expected):
+        # 命令行 --yes 模式下跳过确认
+        if self.assume_yes:
+            return True
+        answer = input(prompt)
+        return answer == expected or answer.lower() == expected
+
+
+def run_command(args):
+    """非交互模式: 供脚本 / 定时任务调用, 结果以 JSON 输出"""
+    if args.command.startswith("purge") and not args.yes:
+        print(f"{Colors.FAIL}非交互模式需要 --yes 确认删除{Colors.ENDC}")
+        sys.exit(2)
+
+    results = {}
+    started = time.perf_counter()
+    if args.command in ("purge-redis", "purge-all"):
+        if not RAG_REDIS_URL:
+            print(f"{Colors.FAIL}未配置 RAG_REDIS_URL 环境变量{Colors.ENDC}")
+            sys.exit(1)
+        patterns = args.pattern or _redis_patterns()
+        results["redis"] = purge_redis(redis.from_url(RAG_REDIS_URL), patterns, args.batch_size)
+    if args.command == "reindex":
+        from app.embeddings import build_base_embed_model
+
+        admin = ChromaAdmin(assume_yes=True)
+        source = admin.client.get_collection(args.source)
+        target = open_reindex_target(admin.client, source, args.target, args.backend)
+        embed_model = build_base_embed_model(args.backend)
+        results["reindex"] = reindex_collection(source, target, embed_model, args.batch_size)
+    if args.command == "partition":
+        admin = ChromaAdmin(assume_yes=True)
+        source = admin.client.get_collection(args.source)
+        results["partition"] = partition_collection(
+            admin.client, source, args.base or args.source, args.mode, args.buckets, args.batch_size
+        )
+    if args.command in ("purge-collections", "purge-all"):
+        admin = ChromaAdmin(assume_yes=True)
+        names = args.collections or [c.name for c in admin.client.list_collections()]
+        results["chroma"] = purge_collections(admin.client, names, args.batch_size, args.workers)
+    results["seconds"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ChromaDB 运维工具箱, 不带子命令时进入交互菜单")
+    sub = parser.add_subparsers(dest="command")
+
+    collections = sub.add_parser("purge-collections", help="清空集合数据 (保留集合结构)")
+    collections.add_argument("collections", nargs="*", help="集合名称, 省略则为全部集合")
+
+    redis_cmd = sub.add_parser("purge-redis", help="清除 Redis Ingestion Cache 和 DocStore")
+    redis_cmd.add_argument("--pattern", action="append", help="键匹配模式, 可重复, 默认为两个缓存前缀")
+
+    purge_all = sub.add_parser("purge-all", help="清除 Redis 缓存和所有集合数据")
+    purge_all.set_defaults(collections=None, pattern=None)
+
+    reindex = sub.add_parser("reindex", help="用指定嵌入后端重建集合向量到新集合 (带模型标签)")
+    reindex.add_argument("source", help="源集合名称")
+    reindex.add_argument("target", help="目标集合名称, 检索时将 CHROMA_COLLECTION_NAME 指向它")
+    reindex.add_argument("--backend", choices=["google", "bge"], default="bge")
+    reindex.set_defaults(collections=None, pattern=None)
+
+    partition = sub.add_parser("partition", help="把单个集合的数据按文档迁移到分区集合")
+    partition.add_argument("source", help="源集合名称")
+    partition.add_argument("--base", help="分区集合名前缀, 即检索时的 CHROMA_COLLECTION_NAME, 默认为源集合名称")
+    partition.add_argument("--mode", choices=["bucket", "document"], default="bucket", help="需与 API 的 CHROMA_PARTITION_MODE 一致")
+    partition.add_argument("--buckets", type=int, default=CHROMA_PARTITION_BUCKETS, help="bucket 模式下的分区数量")
+    partition.set_defaults(collections=None, pattern=None)
+
+    for cmd in (collections, redis_cmd, purge_all, reindex, partition):
+        cmd.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+    for cmd in (collections, redis_cmd, purge_all):
+        cmd.add_argument("--yes", action="store_true", help="跳过确认")
+    for cmd in (collections, purge_all):
+        cmd.add_argument("--workers", type=int, default=PURGE_WORKERS, help="并行清理的集合数量")
+    redis_cmd.set_defaults(collections=None)
+    collections.set_defaults(pattern=None)
+    return parser.parse_args(argv)
 
 
 def main():
+    args = parse_args()
+    if args.command:
+        run_command(args)
+        return
+
     admin = ChromaAdmin()
 
     while True:
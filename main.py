@@ -1,4 +1,40 @@
+import os
 import uvicorn
-from app.api import app
+from dotenv import load_dotenv
 
-uvicorn.run(app, host="0.0.0.0", port=8001)
+load_dotenv()
+
+# Local models (bge) are loaded by every worker process, each one holds its
+# own copy in memory
+LOCAL_MODELS = "bge" in (os.getenv("EMBEDDING_BACKEND"), os.getenv("RERANK_BACKEND"))
+# One worker process per core by default (one with local models), each one
+# connects its own clients in the app lifespan, so nothing opened at import is
+# shared across processes
+API_WORKERS = int(os.getenv("API_WORKERS") or (1 if LOCAL_MODELS else os.cpu_count() or 1))
+# Seconds shutdown waits for in-flight SSE streams before cancelling them
+API_GRACEFUL_TIMEOUT = int(os.getenv("API_GRACEFUL_TIMEOUT_S", 60))
+
+if __name__ == "__main__":
+    if API_WORKERS > 1 and LOCAL_MODELS:
+        print(
+            f"[ERROR]: {API_WORKERS} workers with a local bge backend, "
+            "every worker loads its own copy of the models"
+        )
+    if API_WORKERS > 1:
+        # Turns of one thread may reach different workers, serialize them in Redis;
+        # document invalidations reach every worker through the same Redis
+        shared_redis = os.getenv("CACHE_REDIS_URL") or os.getenv("RAG_REDIS_URL")
+        if shared_redis:
+            os.environ.setdefault("ADMISSION_REDIS_URL", shared_redis)
+        else:
+            print(
+                "[ERROR]: no Redis configured, turns of a thread are only serialized "
+                "per worker and document invalidations only reach one worker"
+            )
+    uvicorn.run(
+        "app.api:app",
+        host="0.0.0.0",
+        port=8001,
+        workers=API_WORKERS,
+        timeout_graceful_shutdown=API_GRACEFUL_TIMEOUT,
+    )
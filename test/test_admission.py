@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from app.admission import AdmissionController, Overloaded
+
+
+def test_same_thread_runs_in_order():
+    async def run():
+        controller = AdmissionController(max_concurrent=4, max_queue=10)
+        order = []
+
+        async def turn(i):
+            async with controller.admit("thread-1"):
+                order.append(f"start {i}")
+                await asyncio.sleep(0.01)
+                order.append(f"end {i}")
+
+        await asyncio.gather(*[turn(i) for i in range(3)])
+        return order, controller.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ["start 0", "end 0", "start 1", "end 1", "start 2", "end 2"]
+    assert stats["admitted"] == 3
+    assert stats["threads"] == 0
+
+
+def test_global_limit_and_queue_rejection():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=1)
+        first = await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        assert controller.stats()["queue_depth"] == 1
+        with pytest.raises(Overloaded) as excinfo:
+            await controller.acquire("c")
+        assert excinfo.value.retry_after >= 1
+        first.release()
+        second = await waiter
+        second.release()
+        second.release()
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["rejected"] == 1
+    assert stats["active"] == 0
+
+
+def test_queue_timeout_sheds_request():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=5, queue_timeout=0.01)
+        ticket = await controller.acquire("a")
+        with pytest.raises(Overloaded):
+            await controller.acquire("b")
+        ticket.release()
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["timed_out"] == 1
+    assert stats["threads"] == 0
+
+
+def test_redis_outage_falls_back_to_local_lock():
+    from redis.exceptions import ConnectionError as RedisConnectionError
+
+    class DownLock:
+        async def acquire(self):
+            raise RedisConnectionError("connection refused")
+
+    class DownRedis:
+        def lock(self, *args, **kwargs):
+            return DownLock()
+
+    async def run():
+        controller = AdmissionController(max_concurrent=2, max_queue=5)
+        controller._redis = DownRedis()
+        async with controller.admit("thread-1"):
+            pass
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["admitted"] == 1
+    assert stats["shared_lock_errors"] == 1
+    assert stats["threads"] == 0
@@ -0,0 +1,69 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+from app import api, retrieval
+from app.batch import answer_all
+
+
+def test_answer_all_bounds_concurrency_and_isolates_errors():
+    running = peak = 0
+
+    async def answer(index, question):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # Later questions finish first
+        await asyncio.sleep(0.01 * (6 - index))
+        running -= 1
+        if question == "bad":
+            raise ValueError("no answer")
+        return question.upper()
+
+    async def collect():
+        return [r async for r in answer_all(["a", "b", "bad", "d", "e", "f"], answer, 2)]
+
+    results = asyncio.run(collect())
+    assert peak == 2
+    assert [r["index"] for r in results] != sorted(r["index"] for r in results)
+    by_index = {r["index"]: r for r in results}
+    assert by_index[0]["answer"] == "A"
+    assert by_index[2]["answer"] is None and by_index[2]["error"] == "no answer"
+    assert all(r["seconds"] > 0 for r in results)
+
+
+class FakeAgent:
+    def __init__(self):
+        self.threads = set()
+
+    async def ainvoke(self, state, config, context):
+        self.threads.add(config["configurable"]["thread_id"])
+        question = state["messages"][0]["content"]
+        if question == "fail":
+            raise RuntimeError("model error")
+        return {"messages": [AIMessage(content=f"{context.doc_content_hash}: {question}")]}
+
+
+def test_ask_returns_input_order_and_streams_ndjson(monkeypatch):
+    async def prepare(doc_content_hash):
+        pass
+
+    monkeypatch.setattr(retrieval, "aprepare_document", prepare)
+    agent = FakeAgent()
+    monkeypatch.setattr(api.app.state, "startup", SimpleNamespace(ready=True), raising=False)
+    monkeypatch.setattr(api.app.state, "batch_agent", agent, raising=False)
+    client = TestClient(api.app)
+    payload = {"doc_content_hash": "doc-1", "questions": ["q1", "fail", "q3"]}
+
+    body = client.post("/ask", json=payload).json()
+    assert [r["answer"] for r in body["results"]] == ["doc-1: q1", None, "doc-1: q3"]
+    assert body["results"][1]["error"] == "model error"
+    assert len(agent.threads) == 3
+
+    response = client.post("/ask/stream", json=payload)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(r["index"] for r in lines) == [0, 1, 2]
+
+    assert client.post("/ask", json={"doc_content_hash": "doc-1", "questions": []}).status_code == 422
@@ -0,0 +1,212 @@
+import asyncio
+import sys
+import pytest
+import redis
+from app.cache import AnswerCache, EmbeddingCache, _DocumentVectors, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  What   is\tQ-7? ") == normalize_query("what is q-7?")
+
+
+def test_embedding_cache_local_hit():
+    cache = EmbeddingCache(redis_url=None)
+    assert cache.get("model", "Chronos-X chip") is None
+    cache.put("model", "Chronos-X chip", [0.1, 0.2, 0.3])
+    # Stored as float32, like the Redis tier
+    assert cache.get("model", " chronos-x  CHIP ") == pytest.approx([0.1, 0.2, 0.3])
+    assert cache.get("other-model", "Chronos-X chip") is None
+    stats = cache.stats()
+    assert stats["hits_local"] == 1
+    assert stats["misses"] == 2
+
+
+def test_embedding_cache_memory_cap():
+    cache = EmbeddingCache(redis_url=None, max_bytes=1024)
+    for i in range(10):
+        cache.put("model", f"query {i}", [0.0] * 64)
+    assert cache.stats()["local_bytes"] <= 1024
+    assert cache.get("model", "query 9") is not None
+    assert cache.get("model", "query 0") is None
+
+
+def _vectors(entries: dict) -> _DocumentVectors:
+    return _DocumentVectors.from_redis(
+        {entry_id: AnswerCache._encode_vector(v, mode) for entry_id, (v, mode) in entries.items()}
+    )
+
+
+def test_embedding_cache_counts_real_size():
+    cache = EmbeddingCache(redis_url=None, max_bytes=1024 * 1024)
+    for i in range(50):
+        cache.put("model", f"query {i}", [0.5] * 3072)
+    held = sum(sys.getsizeof(entry[0]) for entry in cache._local._items.values())
+    assert held <= cache.stats()["local_bytes"] <= 1024 * 1024
+
+
+def test_answer_cache_best_match_threshold():
+    vectors = _vectors({b"a": ([1.0, 0.0, 0.0], "answer"), b"b": ([0.0, 1.0, 0.0], "answer")})
+    assert vectors.best([0.1, 0.99, 0.0], "answer", 0.9) == b"b"
+    assert vectors.best([0.7, 0.7, 0.0], "answer", 0.9) is None
+    assert _vectors({}).best([1.0, 0.0, 0.0], "answer", 0.9) is None
+    # Vectors of another dimension are not comparable
+    assert vectors.best([1.0, 0.0], "answer", 0.9) is None
+
+
+def test_answer_cache_disabled_without_redis():
+    cache = AnswerCache(redis_url=None)
+    assert not cache.enabled
+    assert cache.get("doc", [1.0]) is None
+    assert cache.invalidate("doc") == 0
+
+
+def test_answer_cache_separates_modes():
+    entries = {b"a": ([1.0, 0.0], "answer")}
+    assert _vectors(entries).best([1.0, 0.0], "context", 0.9) is None
+    entries[b"c"] = ([1.0, 0.0], "context")
+    assert _vectors(entries).best([1.0, 0.0], "context", 0.9) == b"c"
+
+
+class FakeAsyncRedis:
+    """The subset of redis.asyncio used by AnswerCache, counting transfers."""
+
+    def __init__(self):
+        self.data = {}
+        self.hgetall_calls = 0
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        value = self.data.get(key)
+        return str(value).encode() if value is not None else None
+
+    async def hgetall(self, key):
+        self.hgetall_calls += 1
+        return dict(self.data.get(key, {}))
+
+    async def hget(self, key, field):
+        return self.data.get(key, {}).get(field.encode() if isinstance(field, str) else field)
+
+    async def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    async def zpopmin(self, key, count):
+        items = sorted(self.data[key].items(), key=lambda kv: kv[1])[:count]
+        for member, _ in items:
+            del self.data[key][member]
+        return items
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+        self.watched = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def watch(self, key):
+        self.watched = (key, self.redis.data.get(key))
+
+    async def get(self, key):
+        return await self.redis.get(key)
+
+    def multi(self):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args: self.ops.append((name, args))
+
+    async def execute(self):
+        data, results = self.redis.data, []
+        if self.watched is not None and data.get(self.watched[0]) != self.watched[1]:
+            raise redis.WatchError(self.watched[0])
+        for name, args in self.ops:
+            if name == "hset":
+                data.setdefault(args[0], {})[args[1].encode()] = (
+                    args[2].encode() if isinstance(args[2], str) else args[2]
+                )
+            elif name == "hdel":
+                for field in args[1:]:
+                    data.get(args[0], {}).pop(field.encode() if isinstance(field, str) else field, None)
+            elif name == "zadd":
+                data.setdefault(args[0], {}).update({k.encode(): v for k, v in args[1].items()})
+            elif name == "incr":
+                data[args[0]] = data.get(args[0], 0) + 1
+            elif name == "zcard":
+                results.append(len(data.get(args[0], {})))
+                continue
+            elif name == "unlink":
+                results.append(sum(data.pop(key, None) is not None for key in args))
+                continue
+            results.append(None)
+        return results
+
+
+def test_answer_cache_reuses_vectors_until_the_version_moves():
+    cache = AnswerCache(redis_url=None, threshold=0.9, max_entries=2)
+    cache._redis = cache._aredis = fake = FakeAsyncRedis()
+
+    async def run():
+        await cache.aput("doc", "q1", [1.0, 0.0], "answer 1", generation=0)
+        assert await cache.aget("doc", [0.99, 0.05]) == "answer 1"
+        assert await cache.aget("doc", [1.0, 0.01]) == "answer 1"
+        # Unchanged version: the vectors were transferred once
+        assert fake.hgetall_calls == 1
+        await cache.aput("doc", "q2", [0.0, 1.0], "answer 2", generation=0)
+        await cache.aput("doc", "q3", [0.6, 0.8], "answer 3", generation=0)
+        # q1 was evicted, its vector is gone with it
+        assert await cache.aget("doc", [1.0, 0.0]) is None
+        assert fake.hgetall_calls == 2
+        await cache.ainvalidate("doc")
+        assert await cache.aget("doc", [0.0, 1.0]) is None
+
+    asyncio.run(run())
+    assert cache.stats()["evictions"] == 1
+
+
+def test_answer_cache_drops_answers_of_a_reingested_document():
+    cache = AnswerCache(redis_url=None, threshold=0.9)
+    cache._redis = cache._aredis = FakeAsyncRedis()
+
+    async def run():
+        generation = await cache.ageneration("doc")
+        # Re-ingested while the search was retrieving
+        await cache.ainvalidate("doc")
+        await cache.aput("doc", "q1", [1.0, 0.0], "stale", generation=generation)
+        assert await cache.aget("doc", [1.0, 0.0]) is None
+        await cache.aput("doc", "q1", [1.0, 0.0], "fresh", generation=await cache.ageneration("doc"))
+        assert await cache.aget("doc", [1.0, 0.0]) == "fresh"
+
+    asyncio.run(run())
+    assert cache.stats()["stale_puts"] == 1
+
+
+def test_answer_cache_invalidate_survives_redis_outage():
+    class DownRedis:
+        def pipeline(self):
+            raise redis.ConnectionError("connection refused")
+
+    cache = AnswerCache(redis_url=None)
+    cache._redis = cache._aredis = DownRedis()
+    assert cache.invalidate("doc") == 0
+    assert asyncio.run(cache.ainvalidate("doc")) == 0
+
+
+def test_answer_cache_keys_are_namespaced_by_embedding_model():
+    google = AnswerCache(redis_url=None, threshold=0.9, namespace="google:model")
+    bge = AnswerCache(redis_url=None, threshold=0.9, namespace="bge:model")
+    google._redis = google._aredis = bge._redis = bge._aredis = FakeAsyncRedis()
+
+    async def run():
+        await google.aput("doc", "q1", [1.0, 0.0], "google answer", generation=0)
+        # Same dimension, but another model's vector space
+        assert await bge.aget("doc", [1.0, 0.0]) is None
+        assert await google.aget("doc", [1.0, 0.0]) == "google answer"
+
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+from langgraph.checkpoint.base import empty_checkpoint
+from psycopg_pool import AsyncConnectionPool
+from app.checkpointer import InstrumentedAsyncPostgresSaver
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, *args, **kwargs):
+        await asyncio.sleep(0.05)
+
+    async def executemany(self, *args, **kwargs):
+        await asyncio.sleep(0.05)
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self.pool)
+
+    def pipeline(self):
+        return _async(nullcontext())
+
+    def transaction(self):
+        return _async(nullcontext())
+
+
+@asynccontextmanager
+async def _async(context):
+    with context:
+        yield
+
+
+class FakePool(AsyncConnectionPool):
+    """Counts connections checked out at the same time."""
+
+    def __init__(self):
+        self.in_use = 0
+        self.peak = 0
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        self.in_use += 1
+        self.peak = max(self.peak, self.in_use)
+        try:
+            yield FakeConnection(self)
+        finally:
+            self.in_use -= 1
+
+    def __del__(self):
+        pass
+
+
+def test_concurrent_puts_use_separate_connections():
+    pool = FakePool()
+
+    async def run():
+        saver = InstrumentedAsyncPostgresSaver(pool)
+
+        async def put(thread_id):
+            config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+            await saver.aput(config, empty_checkpoint(), {}, {})
+
+        await asyncio.gather(put("a"), put("b"))
+
+    asyncio.run(run())
+    assert pool.peak == 2
@@ -0,0 +1,74 @@
+import uuid
+import chromadb
+from chroma_ops import (
+    open_reindex_target,
+    partition_collection,
+    purge_collection,
+    purge_collections,
+    reindex_collection,
+)
+from bench.fakes import FakeEmbedding
+
+
+def _collection(client, size):
+    col = client.create_collection(f"purge-{uuid.uuid4().hex[:8]}")
+    col.add(ids=[str(i) for i in range(size)], embeddings=[[0.1, 0.2]] * size)
+    return col
+
+
+def test_purge_collection_pages_until_empty():
+    col = _collection(chromadb.EphemeralClient(), 23)
+    result = purge_collection(col, batch_size=5)
+    assert result["deleted"] == 23
+    assert col.count() == 0
+
+
+def test_purge_collections_in_parallel():
+    client = chromadb.EphemeralClient()
+    cols = [_collection(client, n) for n in (7, 12)]
+    results = purge_collections(client, [c.name for c in cols] + ["missing-col"], 4, 2)
+    assert [results[c.name]["deleted"] for c in cols] == [7, 12]
+    assert "error" in results["missing-col"]
+    assert all(c.count() == 0 for c in cols)
+
+
+def test_reindex_into_tagged_collection():
+    client = chromadb.EphemeralClient()
+    source = client.create_collection(
+        f"src-{uuid.uuid4().hex[:8]}", metadata={"hnsw:space": "cosine"}
+    )
+    source.add(
+        ids=[str(i) for i in range(9)],
+        embeddings=[[0.1, 0.2]] * 9,
+        documents=[f"chunk {i}" for i in range(9)],
+        metadatas=[{"doc_content_hash": "d"}] * 9,
+    )
+    target = open_reindex_target(client, source, f"dst-{uuid.uuid4().hex[:8]}", "bge")
+    result = reindex_collection(source, target, FakeEmbedding(dim=8), batch_size=4)
+
+    assert result["written"] == 9
+    assert target.metadata["embedding_model"].startswith("bge:")
+    assert target.metadata["hnsw:space"] == "cosine"
+    copied = target.get(ids=["3"], include=["embeddings", "documents", "metadatas"])
+    assert copied["documents"] == ["chunk 3"]
+    assert len(copied["embeddings"][0]) == 8
+
+
+def test_partition_moves_documents_to_their_collections():
+    client = chromadb.EphemeralClient()
+    source = client.create_collection(
+        f"part-{uuid.uuid4().hex[:8]}", metadata={"hnsw:space": "cosine"}
+    )
+    source.add(
+        ids=[str(i) for i in range(12)],
+        embeddings=[[0.1, float(i)] for i in range(12)],
+        documents=[f"chunk {i}" for i in range(12)],
+        metadatas=[{"doc_content_hash": f"doc-{i % 3}"} for i in range(11)] + [{"page": 1}],
+    )
+    result = partition_collection(client, source, source.name, "document", 0, batch_size=5)
+
+    assert (result["written"], result["skipped"], result["partitions"]) == (11, 1, 3)
+    target = client.get_collection(f"{source.name}-d-doc-1")
+    assert sorted(target.get()["ids"], key=int) == ["1", "4", "7", "10"]
+    assert target.metadata["hnsw:space"] == "cosine"
+    assert source.count() == 12
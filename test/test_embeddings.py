@@ -0,0 +1,112 @@
+import asyncio
+import chromadb
+import pytest
+from app import embeddings
+from app.embeddings import EmbeddingProcess, LocalEmbedding, QueryBatcher, check_collection_tag
+from bench.fakes import FakeEmbedding, load_fake_encoder
+
+
+def test_embedding_process_batches_concurrent_queries():
+    process = EmbeddingProcess("fake", load_encoder=load_fake_encoder, wait_ms=20)
+    try:
+        model = LocalEmbedding(process, "fake")
+
+        async def run():
+            queries = [f"query {i}" for i in range(16)]
+            return queries, await asyncio.gather(
+                *[model.aget_query_embedding(q) for q in queries]
+            )
+
+        queries, vectors = asyncio.run(run())
+        assert vectors == [pytest.approx(FakeEmbedding()._vector(q)) for q in queries]
+        assert model.get_text_embedding_batch(["a", "b"])[1] == pytest.approx(
+            FakeEmbedding()._vector("b")
+        )
+        stats = process.stats()
+        assert stats["texts"] == 18
+        assert stats["batches"] < 16
+    finally:
+        process.close()
+
+
+def test_embedding_process_survives_cancel_and_fails_on_exit():
+    process = EmbeddingProcess("fake", load_encoder=load_fake_encoder, wait_ms=0)
+    try:
+
+        async def run():
+            cancelled = asyncio.ensure_future(process.aembed(["gone"]))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            return await asyncio.wait_for(process.aembed(["kept"]), timeout=5)
+
+        assert asyncio.run(run())[0] == pytest.approx(FakeEmbedding()._vector("kept"))
+
+        process._process.kill()
+        with pytest.raises(RuntimeError, match="exited"):
+            process.submit(["late"]).result(timeout=5)
+    finally:
+        process.close()
+
+
+def test_collection_tag_check(monkeypatch):
+    client = chromadb.EphemeralClient()
+    legacy = client.get_or_create_collection("legacy-google")
+    local = client.get_or_create_collection(
+        "local-bge", metadata={"embedding_model": "bge:BAAI/bge-m3"}
+    )
+    monkeypatch.setattr(embeddings, "BGE_EMBED_MODEL", "BAAI/bge-m3")
+
+    check_collection_tag(legacy, "google")
+    check_collection_tag(local, "bge")
+    with pytest.raises(ValueError):
+        check_collection_tag(legacy, "bge")
+    with pytest.raises(ValueError):
+        check_collection_tag(local, "google")
+
+
+def test_query_batcher_coalesces_concurrent_queries():
+    calls = []
+
+    async def batch_fn(queries):
+        calls.append(list(queries))
+        return [[float(len(q))] for q in queries]
+
+    async def run():
+        batcher = QueryBatcher(batch_fn, max_batch=4, wait_ms=20)
+        queries = ["a", "bb", "a", "ccc", "dddd", "ee"]
+        vectors = await asyncio.gather(*[batcher.embed(q) for q in queries])
+        return vectors, batcher.stats()
+
+    vectors, stats = asyncio.run(run())
+    assert vectors == [[1.0], [2.0], [1.0], [3.0], [4.0], [2.0]]
+    # The first four fill a batch, the other two go out when the window closes
+    assert calls == [["a", "bb", "ccc"], ["dddd", "ee"]]
+    assert stats["batches"] == 2
+    assert stats["queries"] == 6
+
+
+def test_query_batcher_propagates_errors():
+    async def batch_fn(queries):
+        raise ConnectionError("quota exceeded")
+
+    async def run():
+        batcher = QueryBatcher(batch_fn, wait_ms=1)
+        return await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+
+def test_query_batcher_fails_short_responses():
+    async def batch_fn(queries):
+        return [[1.0]]
+
+    async def run():
+        batcher = QueryBatcher(batch_fn, wait_ms=1)
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True),
+            timeout=2,
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
@@ -0,0 +1,62 @@
+import asyncio
+import uuid
+import chromadb
+from app import retrieval
+from bench.eval_retrieval import cheapest, evaluate, recall_at_k, reciprocal_rank
+from bench.fakes import FakeEmbedding, FakeLLM, build_corpus, stub_reranker
+
+
+def test_recall_and_reciprocal_rank():
+    retrieved = ["a", "b", "c", "d"]
+    assert recall_at_k(retrieved, ["b", "x"], k=2) == 0.5
+    assert recall_at_k(retrieved, ["d"], k=3) == 0.0
+    assert reciprocal_rank(retrieved, ["c", "d"]) == 1 / 3
+    assert reciprocal_rank(retrieved, ["x"]) == 0.0
+
+
+def test_cheapest_meets_target():
+    rows = [
+        {"top_k": 20, "top_n": 6, "recall": 0.95, "p95_ms": 300},
+        {"top_k": 10, "top_n": 4, "recall": 0.91, "p95_ms": 200},
+        {"top_k": 5, "top_n": 3, "recall": 0.80, "p95_ms": 120},
+    ]
+    assert cheapest(rows, 0.9)["top_k"] == 10
+    assert cheapest(rows, 0.99) is None
+
+
+def test_evaluate_finds_exact_chunks(monkeypatch):
+    for name in ("_vector_store", "hot_index", "_index", "_embed_model", "_llm",
+                 "_response_synthesizer", "_reranker", "router"):
+        monkeypatch.setattr(retrieval, name, getattr(retrieval, name))
+    embed_model = FakeEmbedding()
+    collection = chromadb.EphemeralClient().create_collection(f"eval-{uuid.uuid4().hex[:8]}")
+    build_corpus(collection, embed_model, docs=2, chunks_per_doc=20)
+    retrieval.init(
+        collection=collection,
+        embed_model=embed_model,
+        llm=FakeLLM(latency=0),
+        reranker=stub_reranker(),
+    )
+
+    chunks = collection.get(where={"doc_content_hash": "doc-0001"}, limit=5, include=["documents"])
+    # A chunk's own text embeds to the same vector, so it must rank first
+    golden = [
+        {"query": text, "doc_content_hash": "doc-0001", "expected_ids": [node_id]}
+        for node_id, text in zip(chunks["ids"], chunks["documents"])
+    ]
+    row = asyncio.run(
+        evaluate(golden, top_k=5, top_n=3, cache="off", embed_models={"off": embed_model},
+                 reranker=stub_reranker(top_n=3))
+    )
+    assert row["queries"] == 5
+    assert row["recall"] == 1.0
+    assert row["mrr"] == 1.0
+
+    if retrieval.hot_index is not None:
+        warm = asyncio.run(
+            evaluate(golden, top_k=5, top_n=3, cache="warm", embed_models={"warm": embed_model},
+                     reranker=stub_reranker(top_n=3))
+        )
+        assert warm["recall"] == 1.0
+        # Loaded before timing, so no query fell back to Chroma
+        assert retrieval.hot_index.stats()["misses"] == 0
@@ -0,0 +1,55 @@
+import asyncio
+from langchain_core.messages import HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from app import history, retrieval
+from app.agent import Context, build_agent
+from app.history import TRUNCATED_MARKER, TruncateToolOutputs
+from bench.fakes import FakeChatModel
+
+
+def test_truncates_tool_outputs_of_previous_turns_only():
+    old = ToolMessage(content="x" * 1000, tool_call_id="a", id="old")
+    current = ToolMessage(content="y" * 1000, tool_call_id="b", id="current")
+    state = {
+        "messages": [HumanMessage("q1"), old, HumanMessage("q2"), current]
+    }
+    update = TruncateToolOutputs(max_tokens=10).before_model(state, None)
+    (message,) = update["messages"]
+    # Same id, so the checkpoint entry is replaced rather than appended
+    assert message.id == "old"
+    assert message.content == "x" * 40 + TRUNCATED_MARKER
+
+    state["messages"][1] = message
+    assert TruncateToolOutputs(max_tokens=10).before_model(state, None) is None
+
+
+def test_history_stays_bounded_on_long_threads(monkeypatch):
+    async def fake_search(query, doc_content_hash, mode):
+        return "context " * 500
+
+    monkeypatch.setattr(retrieval, "asearch", fake_search)
+    monkeypatch.setattr(history, "HISTORY_TOKEN_BUDGET", 1500)
+    monkeypatch.setattr(history, "HISTORY_KEEP_TOKENS", 600)
+    agent = build_agent(
+        InMemorySaver(), FakeChatModel(latency=0, token_latency=0, answer_tokens=20)
+    )
+    config = {"configurable": {"thread_id": "long"}}
+
+    async def run():
+        sizes = []
+        for turn in range(50):
+            async for _ in agent.astream(
+                {"messages": [{"role": "user", "content": f"question {turn}"}]},
+                config,
+                context=Context(doc_content_hash="doc"),
+                stream_mode="messages",
+            ):
+                pass
+            state = await agent.aget_state(config)
+            sizes.append(len(state.values["messages"]))
+        return sizes, state.values["messages"]
+
+    sizes, messages = asyncio.run(run())
+    # Without compaction the thread would hold 4 messages per turn
+    assert max(sizes[25:]) < 40
+    assert messages[0].content.startswith("Here is a summary")
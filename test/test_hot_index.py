@@ -0,0 +1,73 @@
+import chromadb
+import numpy as np
+from llama_index.core.schema import QueryBundle
+from app.hot_index import HotDocumentIndex, HotDocumentRetriever
+
+
+def _collection(name: str):
+    rng = np.random.default_rng(0)
+    client = chromadb.EphemeralClient()
+    col = client.get_or_create_collection(name)
+    embeddings = rng.normal(size=(40, 8)).astype(np.float32)
+    col.add(
+        ids=[f"chunk-{i}" for i in range(40)],
+        embeddings=embeddings.tolist(),
+        documents=[f"text {i}" for i in range(40)],
+        metadatas=[{"doc_content_hash": "doc-a" if i < 30 else "doc-b"} for i in range(40)],
+    )
+    return col, embeddings
+
+
+def test_hot_index_matches_chroma_ranking():
+    col, embeddings = _collection("hot-index-ranking")
+    index = HotDocumentIndex(col)
+    doc = index.load("doc-a")
+    assert len(doc) == 30
+
+    query = embeddings[3] + 0.01
+    expected = col.query(
+        query_embeddings=[query.tolist()], n_results=5, where={"doc_content_hash": "doc-a"}
+    )["ids"][0]
+    assert [n.node.node_id for n in doc.search(query, 5)] == expected
+
+
+def test_hot_index_miss_falls_back_then_hits():
+    col, embeddings = _collection("hot-index-fallback")
+    index = HotDocumentIndex(col)
+
+    class Fallback:
+        calls = 0
+
+        def retrieve(self, query_bundle):
+            Fallback.calls += 1
+            return []
+
+    retriever = HotDocumentRetriever(index, "doc-b", 3, Fallback(), embed_model=None)
+    bundle = QueryBundle("q", embedding=embeddings[35].tolist())
+    assert retriever.retrieve(bundle) == []
+    assert Fallback.calls == 1
+
+    index._executor.shutdown(wait=True)
+    nodes = retriever.retrieve(bundle)
+    assert nodes[0].node.node_id == "chunk-35"
+    assert index.stats()["hits"] == 1
+
+    index.evict("doc-b")
+    assert index.stats()["documents"] == 0
+
+
+def test_hot_index_ensure_loads_once():
+    col, _ = _collection("hot-index-ensure")
+    index = HotDocumentIndex(collection_for=lambda doc_hash: col)
+    assert len(index.ensure("doc-b")) == 10
+    assert index.ensure("doc-b") is index.ensure("doc-b")
+    assert index.stats()["loads"] == 1
+
+
+def test_hot_index_clear_evicts_everything():
+    col, _ = _collection("hot-index-clear")
+    index = HotDocumentIndex(col)
+    index.ensure("doc-a")
+    index.clear()
+    assert index.stats()["documents"] == 0 and index.stats()["bytes"] == 0
+    assert len(index.ensure("doc-a")) == 30
@@ -0,0 +1,63 @@
+import asyncio
+from app.invalidation import DocumentInvalidation
+
+
+class FakePubSub:
+    def __init__(self, broker):
+        self.broker = broker
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.broker.subscribers.append(self)
+
+    async def listen(self):
+        yield {"type": "subscribe", "data": 1}
+        while True:
+            yield await self.queue.get()
+
+    async def aclose(self):
+        self.broker.subscribers.remove(self)
+
+
+class FakeRedis:
+    """In-process stand-in for Redis pub/sub shared by several workers."""
+
+    def __init__(self):
+        self.subscribers = []
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    async def publish(self, channel, message):
+        for subscriber in self.subscribers:
+            subscriber.queue.put_nowait({"type": "message", "data": message.encode()})
+
+
+def test_invalidation_reaches_every_worker():
+    broker = FakeRedis()
+
+    async def run():
+        evicted = {"a": [], "b": []}
+        resyncs = {"a": 0, "b": 0}
+
+        def worker(name):
+            def resync():
+                resyncs[name] += 1
+
+            return DocumentInvalidation(broker, evicted[name].append, resync)
+
+        workers = [worker("a"), worker("b")]
+        for w in workers:
+            w.start()
+        await asyncio.gather(*[w.subscribed.wait() for w in workers])
+        await workers[0].publish("doc-1")
+        await asyncio.sleep(0.05)
+        for w in workers:
+            await w.stop()
+        return evicted, resyncs, workers[1].stats()
+
+    evicted, resyncs, stats = asyncio.run(run())
+    assert evicted == {"a": ["doc-1"], "b": ["doc-1"]}
+    assert resyncs == {"a": 1, "b": 1}
+    assert stats["received"] == 1
+    assert broker.subscribers == []
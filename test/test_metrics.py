@@ -0,0 +1,32 @@
+import json
+from app.metrics import Histogram, render_stats, request_trace, span
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("qa_test_seconds", "test", buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="rerank")
+    histogram.observe(0.5, stage="rerank")
+    histogram.observe(5.0, stage="rerank")
+    lines = histogram.render()
+    assert 'qa_test_seconds_bucket{stage="rerank",le="0.1"} 1' in lines
+    assert 'qa_test_seconds_bucket{stage="rerank",le="1.0"} 2' in lines
+    assert 'qa_test_seconds_bucket{stage="rerank",le="+Inf"} 3' in lines
+    assert 'qa_test_seconds_count{stage="rerank"} 3' in lines
+
+
+def test_request_trace_collects_spans(capsys):
+    with request_trace(route="/chat", thread_id="t1"):
+        with span("retrieve", tool="search_vdb") as labels:
+            labels["source"] = "hot"
+    with span("rerank"):
+        pass
+
+    record = json.loads(capsys.readouterr().out.strip())
+    assert record["thread_id"] == "t1"
+    assert [s["stage"] for s in record["spans"]] == ["retrieve"]
+    assert record["spans"][0]["source"] == "hot"
+
+
+def test_render_stats_flattens_numbers():
+    lines = render_stats("qa_admission", {"active": 2, "pool": {"size": 3}, "name": "x"})
+    assert lines == ["qa_admission_active 2", "qa_admission_pool_size 3"]
@@ -0,0 +1,64 @@
+import uuid
+import chromadb
+from llama_index.core import QueryBundle
+from app import retrieval
+from app.partitions import PartitionRouter, partition_name
+from chroma_ops import partition_collection
+from bench.fakes import FakeEmbedding, FakeLLM, build_corpus, stub_reranker
+
+
+def test_partition_names_are_stable_and_valid():
+    assert partition_name("docs", "abc", mode="single") == "docs"
+    assert partition_name("docs", "a/b c", mode="document") == "docs-d-a_b_c"
+    names = {partition_name("docs", f"doc-{i}", mode="bucket", buckets=4) for i in range(50)}
+    assert names == {f"docs-b{i:04d}" for i in range(4)}
+    assert partition_name("docs", "doc-7", "bucket", 4) == partition_name("docs", "doc-7", "bucket", 4)
+
+
+def test_retrieval_through_router(monkeypatch):
+    for name in ("_vector_store", "hot_index", "_index", "_embed_model", "_llm",
+                 "_response_synthesizer", "_reranker", "router"):
+        monkeypatch.setattr(retrieval, name, getattr(retrieval, name))
+    client = chromadb.EphemeralClient()
+    source = client.create_collection(f"routed-{uuid.uuid4().hex[:8]}")
+    embed_model = FakeEmbedding()
+    build_corpus(source, embed_model, docs=5, chunks_per_doc=8)
+    partition_collection(client, source, source.name, "bucket", 2, batch_size=7)
+    router = PartitionRouter(client, source.name, mode="bucket", buckets=2, max_open=1)
+    retrieval.init(
+        embed_model=embed_model,
+        llm=FakeLLM(latency=0),
+        reranker=stub_reranker(),
+        partitions=router,
+    )
+
+    chunk = router.get("doc-0002").get(
+        where={"doc_content_hash": "doc-0002"}, limit=1, include=["documents"]
+    )
+    query = QueryBundle(chunk["documents"][0], embedding=embed_model._vector(chunk["documents"][0]))
+    nodes = retrieval.retrieve(query, "doc-0002", use_hot_index=False)
+    assert nodes[0].node.node_id == chunk["ids"][0]
+    assert {n.node.metadata["doc_content_hash"] for n in nodes} == {"doc-0002"}
+    # The search ran over one bucket, not the whole corpus
+    assert router.get("doc-0002").count() < source.count()
+    assert router.stats()["hits"] >= 2
+
+
+def test_unknown_document_creates_no_partition(monkeypatch):
+    for name in ("_vector_store", "hot_index", "_index", "_embed_model", "_llm",
+                 "_response_synthesizer", "_reranker", "router"):
+        monkeypatch.setattr(retrieval, name, getattr(retrieval, name))
+    client = chromadb.EphemeralClient()
+    base = f"typo-{uuid.uuid4().hex[:8]}"
+    router = PartitionRouter(client, base, mode="document")
+    retrieval.init(
+        embed_model=FakeEmbedding(),
+        llm=FakeLLM(latency=0),
+        reranker=stub_reranker(),
+        partitions=router,
+    )
+
+    assert retrieval.search("anything?", "typo-hash", mode="answer") == retrieval.NO_CONTEXT
+    assert router.get("typo-hash") is None
+    assert not [c for c in client.list_collections() if c.name.startswith(base)]
+    assert router.get_or_create("new-doc").name == f"{base}-d-new-doc"
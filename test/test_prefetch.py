@@ -0,0 +1,47 @@
+import asyncio
+from app.prefetch import Prefetcher
+
+
+def test_taken_prefetch_is_a_hit_and_shared():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "nodes"
+
+    async def run():
+        prefetcher = Prefetcher()
+        prefetcher.start("k", work)
+        prefetcher.start("k", work)
+        result = await prefetcher.take("k")
+        prefetcher.release("k")
+        prefetcher.release("k")
+        return result, prefetcher.stats()
+
+    result, stats = asyncio.run(run())
+    assert result == "nodes"
+    assert calls == [1]
+    assert stats["hits"] == 1
+    assert stats["shared"] == 1
+    assert stats["wasted"] == 0
+    assert stats["in_flight"] == 0
+
+
+def test_untaken_prefetch_is_wasted_and_cancelled():
+    async def work():
+        await asyncio.sleep(10)
+
+    async def run():
+        prefetcher = Prefetcher()
+        prefetcher.start("k", work)
+        task = prefetcher._entries["k"][0]
+        prefetcher.release("k")
+        await asyncio.sleep(0)
+        return task, prefetcher.stats()
+
+    task, stats = asyncio.run(run())
+    assert task.cancelled()
+    assert stats["wasted"] == 1
+    assert stats["wasted_rate"] == 1.0
+    assert Prefetcher().take("missing") is None
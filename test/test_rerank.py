@@ -0,0 +1,47 @@
+import asyncio
+import time
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from app.rerank import RerankWorker, WorkerRerank
+
+
+def _length_score(pairs):
+    return [float(len(passage)) for _, passage in pairs]
+
+
+def test_worker_batches_concurrent_requests():
+    worker = RerankWorker(_length_score, workers=1, max_batch=64, wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(
+            *[worker.ascore([("q", "a" * i), ("q", "b")]) for i in range(1, 9)]
+        )
+
+    results = asyncio.run(run())
+    assert results == [[float(i), 1.0] for i in range(1, 9)]
+    assert worker.stats()["pairs"] == 16
+    assert worker.stats()["batches"] < 8
+
+
+def test_cancelled_waiter_does_not_kill_the_worker():
+    def slow_score(pairs):
+        time.sleep(0.1)
+        return _length_score(pairs)
+
+    worker = RerankWorker(slow_score, workers=1, wait_ms=0)
+
+    async def run():
+        scoring = asyncio.ensure_future(worker.ascore([("q", "abc")]))
+        queued = asyncio.ensure_future(worker.ascore([("q", "abcd")]))
+        await asyncio.sleep(0.03)
+        scoring.cancel()
+        queued.cancel()
+        return await asyncio.wait_for(worker.ascore([("q", "ab")]), timeout=2)
+
+    assert asyncio.run(run()) == [2.0]
+
+
+def test_worker_rerank_keeps_top_n():
+    reranker = WorkerRerank(RerankWorker(_length_score), top_n=2)
+    nodes = [NodeWithScore(node=TextNode(text="x" * n), score=0.0) for n in (3, 1, 5, 2)]
+    ranked = reranker.postprocess_nodes(nodes, QueryBundle("q"))
+    assert [n.node.get_content() for n in ranked] == ["xxxxx", "xxx"]
@@ -0,0 +1,158 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+import pytest
+from app import retention
+from app.retention import CheckpointRetention
+
+
+class FakeCursor:
+    def __init__(self, rows=(), rowcount=0):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    async def fetchone(self):
+        return self.rows[0]
+
+    async def fetchall(self):
+        return self.rows
+
+
+class FakeDatabase:
+    """Answers the collector's statements from two lists of thread ids."""
+
+    def __init__(self, idle, active):
+        self.idle = list(idle)
+        self.active = sorted(active)
+        self.deleted = []
+        self.pruned = []
+        self.transactions = 0
+
+    async def execute(self, query, params=None):
+        if "advisory" in query:
+            return FakeCursor([{"locked": True}])
+        if query == retention._IDLE_THREADS:
+            return FakeCursor({"thread_id": t} for t in self.idle[: params["limit"]])
+        if query == retention._ACTIVE_THREADS:
+            after = [t for t in self.active if t > params["after"]]
+            return FakeCursor({"thread_id": t} for t in after[: params["limit"]])
+        threads = params["threads"]
+        if (query.split()[2], query) in retention._DELETE_THREADS:
+            if query.split()[2] == "checkpoints":
+                self.deleted.append(list(threads))
+                self.idle = [t for t in self.idle if t not in threads]
+            return FakeCursor(rowcount=len(threads))
+        if query.strip().startswith("DELETE FROM checkpoints c USING"):
+            self.pruned.append(list(threads))
+        return FakeCursor(rowcount=1)
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.transactions += 1
+        yield
+
+
+class FakePool:
+    def __init__(self, database):
+        self.database = database
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self.database
+
+
+def test_collect_pages_threads_in_batches():
+    database = FakeDatabase(
+        idle=[f"idle-{i}" for i in range(5)], active=[f"active-{i}" for i in range(3)]
+    )
+    collector = CheckpointRetention(FakePool(database), batch_size=2, batch_pause=0)
+
+    report = asyncio.run(collector.run_once())
+
+    assert database.deleted == [["idle-0", "idle-1"], ["idle-2", "idle-3"], ["idle-4"]]
+    assert database.pruned == [["active-0", "active-1"], ["active-2"]]
+    # One transaction per batch
+    assert database.transactions == 5
+    assert report["threads_expired"] == 5
+    assert report["threads_trimmed"] == 3
+    assert report["rows_deleted"]["checkpoints"] == 5 + 2
+    assert collector.stats()["passes"] == 1
+
+
+def test_collect_skips_when_another_process_holds_the_lock():
+    database = FakeDatabase(idle=["idle-0"], active=[])
+
+    async def locked(query, params=None):
+        return FakeCursor([{"locked": False}])
+
+    database.execute = locked
+    collector = CheckpointRetention(FakePool(database), batch_size=2, batch_pause=0)
+    assert asyncio.run(collector.run_once()) is None
+    assert collector.stats()["passes"] == 0
+
+
+# Runs the statements against the real langgraph schema when a scratch
+# database is available, e.g. TEST_POSTGRES_URL=postgresql://localhost/qa_test
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL not set")
+def test_retention_against_postgres():
+    from langgraph.checkpoint.base import empty_checkpoint
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+
+    async def put(saver, thread_id, step, ts=None):
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        previous = await saver.aget_tuple(config)
+        checkpoint = empty_checkpoint()
+        version = saver.get_next_version(
+            previous.checkpoint["channel_versions"].get("messages") if previous else None, None
+        )
+        checkpoint["channel_values"] = {"messages": [f"message {step}"]}
+        checkpoint["channel_versions"] = {"messages": version}
+        if ts is not None:
+            checkpoint["ts"] = ts
+        if previous:
+            config = previous.config
+        saved = await saver.aput(config, checkpoint, {"step": step}, {"messages": version})
+        await saver.aput_writes(saved, [("messages", f"write {step}")], f"task-{step}")
+
+    async def count(pool, table, thread_id):
+        async with pool.connection() as conn:
+            row = await (
+                await conn.execute(
+                    f"SELECT count(*) AS n FROM {table} WHERE thread_id = %s", (thread_id,)
+                )
+            ).fetchone()
+        return row["n"]
+
+    async def run():
+        kwargs = {"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row}
+        async with AsyncConnectionPool(TEST_POSTGRES_URL, kwargs=kwargs, open=False) as pool:
+            saver = AsyncPostgresSaver(pool)
+            await saver.setup()
+            prefix = f"retention-{os.getpid()}"
+            old = (datetime.now(timezone.utc) - timedelta(days=60)).isoformat()
+            await put(saver, f"{prefix}-idle", 0, ts=old)
+            for step in range(8):
+                await put(saver, f"{prefix}-busy", step)
+
+            collector = CheckpointRetention(pool, keep=3, ttl_days=30, batch_pause=0)
+            await collector.setup()
+            report = await collector.run_once()
+
+            assert report["threads_expired"] >= 1
+            for table in ("checkpoints", "checkpoint_writes", "checkpoint_blobs"):
+                assert await count(pool, table, f"{prefix}-idle") == 0
+            assert await count(pool, "checkpoints", f"{prefix}-busy") == 3
+            assert await count(pool, "checkpoint_writes", f"{prefix}-busy") == 3
+            assert await count(pool, "checkpoint_blobs", f"{prefix}-busy") == 3
+            latest = await saver.aget_tuple(
+                {"configurable": {"thread_id": f"{prefix}-busy", "checkpoint_ns": ""}}
+            )
+            assert latest.checkpoint["channel_values"]["messages"] == ["message 7"]
+
+    asyncio.run(run())
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.singleflight import SingleFlight
+
+
+def test_concurrent_identical_calls_run_once():
+    calls = []
+
+    async def search(query):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return f"answer to {query}"
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(
+            *[flight.arun(("doc", q), lambda q=q: search(q)) for q in ["a", "a", "b", "a"]]
+        )
+        # Completed calls are not cached
+        await flight.arun(("doc", "a"), lambda: search("a"))
+        return results, flight.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == ["answer to a", "answer to a", "answer to b", "answer to a"]
+    assert calls == ["a", "b", "a"]
+    assert stats == {"in_flight": 0, "executions": 3, "collapsed": 2}
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    async def search():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.arun("k", search))
+        second = asyncio.ensure_future(flight.arun("k", search))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_call_is_cancelled_with_its_last_waiter():
+    finished = []
+
+    async def search():
+        await asyncio.sleep(0.05)
+        finished.append(True)
+        return "done"
+
+    async def run():
+        flight = SingleFlight()
+        waiters = [asyncio.ensure_future(flight.arun("k", search)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.sleep(0.1)
+        return flight.stats()
+
+    stats = asyncio.run(run())
+    assert finished == []
+    assert stats["in_flight"] == 0
+
+
+def test_caller_after_cancel_starts_a_new_call():
+    async def search():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.arun("k", search))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        # Let the waiter unwind, but not the cancelled call's done-callback
+        await asyncio.sleep(0)
+        late = await flight.arun("k", search)
+        return late, flight.stats()
+
+    late, stats = asyncio.run(run())
+    assert late == "done"
+    assert stats["executions"] == 2
+    assert stats["collapsed"] == 0
+
+
+def test_sync_variant_shares_result_and_errors():
+    flight = SingleFlight()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.05)
+        raise ConnectionError("chroma down")
+
+    errors = []
+
+    def worker():
+        try:
+            flight.run("k", failing)
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert len(errors) == 4
+    assert flight.stats()["collapsed"] == 3
+    with pytest.raises(ConnectionError):
+        flight.run("k", failing)
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from fastapi.testclient import TestClient
+from app import api, checkpointer, retrieval, startup
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_ready_after_background_startup(monkeypatch):
+    async def slow_init():
+        await asyncio.sleep(0.2)
+
+    async def warm_up():
+        pass
+
+    monkeypatch.setattr(checkpointer, "AGENT_CHECKPOINTER", "memory")
+    monkeypatch.setattr(retrieval, "ainit", slow_init)
+    monkeypatch.setattr(retrieval, "awarm_up", warm_up)
+    monkeypatch.setattr(startup, "get_model", lambda: "model")
+    monkeypatch.setattr(
+        startup,
+        "build_agent",
+        lambda checkpointer, model: "agent" if checkpointer is not None else "batch agent",
+    )
+
+    with TestClient(api.app) as client:
+        # Serving before the dependencies are up
+        assert client.get("/healthz").status_code == 200
+        assert client.get("/readyz").status_code == 503
+        chat = client.post(
+            "/chat", json={"input": "hi", "doc_content_hash": "d", "thread_id": "t"}
+        )
+        assert chat.status_code == 503
+
+        _wait_until(lambda: client.app.state.startup.ready)
+        ready = client.get("/readyz")
+        assert ready.status_code == 200
+        assert ready.json()["seconds"] >= 0.2
+        assert client.app.state.agent == "agent"
+        # /ask runs without a checkpointer
+        assert client.app.state.batch_agent == "batch agent"
+        assert "qa_startup_ready 1" in client.get("/metrics").text
+
+
+def test_failed_dependency_fails_liveness(monkeypatch):
+    async def broken_init():
+        raise ConnectionError("chroma unreachable")
+
+    monkeypatch.setattr(checkpointer, "AGENT_CHECKPOINTER", "memory")
+    monkeypatch.setattr(retrieval, "ainit", broken_init)
+    monkeypatch.setattr(startup, "get_model", lambda: "model")
+
+    with TestClient(api.app) as client:
+        _wait_until(lambda: client.app.state.startup.error is not None)
+        health = client.get("/healthz")
+        assert health.status_code == 503
+        assert "chroma unreachable" in health.json()["error"]
+        assert client.get("/readyz").status_code == 503
@@ -0,0 +1,101 @@
+import asyncio
+from app.streaming import HEARTBEAT_FRAME, sse_stream
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after: int | None = None):
+        self.polls = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        self.polls += 1
+        return self.disconnect_after is not None and self.polls > self.disconnect_after
+
+
+async def _collect(stream):
+    return [frame async for frame in stream]
+
+
+def test_tokens_are_coalesced_by_size():
+    async def chunks():
+        for token in ["ab", "cd", "ef", "gh", "ij"]:
+            yield token
+
+    frames = asyncio.run(
+        _collect(sse_stream(chunks(), FakeRequest(), flush_chars=4, flush_interval=10))
+    )
+    assert frames == ["data: abcd\n\n", "data: efgh\n\n", "data: ij\n\n"]
+
+
+def test_heartbeat_while_waiting_and_error_frame():
+    async def chunks():
+        yield "hello"
+        await asyncio.sleep(0.25)
+        raise RuntimeError("boom")
+
+    frames = asyncio.run(
+        _collect(
+            sse_stream(
+                chunks(),
+                FakeRequest(),
+                flush_interval=0.01,
+                heartbeat_interval=0.1,
+                disconnect_poll=0.05,
+            )
+        )
+    )
+    assert frames[0] == "data: hello\n\n"
+    assert HEARTBEAT_FRAME in frames
+    assert frames[-1] == "data: [ERROR]: boom\n\n"
+
+
+def test_cancelled_chunks_end_the_stream():
+    async def chunks():
+        yield "hello"
+        raise asyncio.CancelledError()
+
+    async def run():
+        return await asyncio.wait_for(
+            _collect(
+                sse_stream(
+                    chunks(),
+                    FakeRequest(),
+                    flush_interval=0.01,
+                    heartbeat_interval=0.05,
+                    disconnect_poll=0.05,
+                )
+            ),
+            timeout=2,
+        )
+
+    frames = asyncio.run(run())
+    assert frames[0] == "data: hello\n\n"
+    assert frames[-1] == "data: [ERROR]: agent run was cancelled\n\n"
+
+
+def test_disconnect_cancels_producer():
+    cancelled = asyncio.Event()
+
+    async def chunks():
+        try:
+            yield "partial"
+            await asyncio.sleep(10)
+            yield "never"
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def run():
+        frames = await _collect(
+            sse_stream(
+                chunks(),
+                FakeRequest(disconnect_after=1),
+                flush_interval=0.01,
+                disconnect_poll=0.02,
+            )
+        )
+        return frames, cancelled.is_set()
+
+    frames, was_cancelled = asyncio.run(run())
+    assert frames == ["data: partial\n\n"]
+    assert was_cancelled